@@ -0,0 +1,44 @@
+"""Shared HTTP clients for external APIs."""
+
+from typing import Any, Optional
+
+import httpx
+import orjson
+
+STRAVA_API_URL = "https://www.strava.com/api/v3"
+
+_strava_client: Optional[httpx.AsyncClient] = None
+
+
+def get_strava_client() -> httpx.AsyncClient:
+    """
+    Get the pooled Strava API client, creating it on first use.
+
+    Reusing one client keeps TCP/TLS connections alive across the many
+    per-activity requests of a sync instead of reconnecting for each call.
+    HTTP/2 lets concurrent requests (e.g. an activity's detail and streams)
+    share one multiplexed connection instead of opening one each.
+    Relative paths resolve against the Strava API base URL.
+    """
+    global _strava_client
+    if _strava_client is None or _strava_client.is_closed:
+        _strava_client = httpx.AsyncClient(
+            base_url=STRAVA_API_URL,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            timeout=httpx.Timeout(30.0),
+        )
+    return _strava_client
+
+
+async def close_http_clients() -> None:
+    """Close the shared clients (application shutdown / end of script)."""
+    global _strava_client
+    if _strava_client is not None:
+        await _strava_client.aclose()
+        _strava_client = None
+
+
+def read_json(response: httpx.Response) -> Any:
+    """Decode a JSON response body straight from bytes with orjson."""
+    return orjson.loads(response.content)
@@ -6,6 +6,7 @@ from contextlib import asynccontextmanager
 
 from app.config import get_settings
 from app.database import engine, Base
+from app.http_clients import close_http_clients
 from app.routers import activities_router, checkins_router, coaching_router
 from app.routers.auth import router as auth_router
 from app.routers.goals import router as goals_router
@@ -21,7 +22,8 @@ async def lifespan(app: FastAPI):
     # Startup: Create database tables
     Base.metadata.create_all(bind=engine)
     yield
-    # Shutdown: Cleanup if needed
+    # Shutdown: Close pooled HTTP connections
+    await close_http_clients()
 
 
 app = FastAPI(
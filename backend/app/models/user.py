@@ -22,6 +22,10 @@ class User(Base):
     strava_access_token = Column(String(512), nullable=True)
     strava_refresh_token = Column(String(512), nullable=True)
     strava_token_expires_at = Column(DateTime, nullable=True)
+    # Window covered by the last sync that completed cleanly (naive UTC):
+    # every activity starting in [since, until] is stored
+    strava_synced_since = Column(DateTime, nullable=True)
+    strava_synced_until = Column(DateTime, nullable=True)
     
     # Google Calendar integration
     google_access_token = Column(String(512), nullable=True)
@@ -243,10 +243,12 @@ def update_classification(
     activity.include_in_training_load = classification.include_in_training_load
     activity.manually_classified = True
     
-    # Recalculate TRIMP if needed
-    if classification.include_in_training_load and activity.average_heartrate:
+    # Recalculate TRIMP on write so metrics reads only sum stored scores
+    if classification.include_in_training_load:
         metrics_service = MetricsService(db)
         activity.trimp_score = metrics_service.calculate_trimp(activity, user)
+    else:
+        activity.trimp_score = None
     
     db.commit()
     db.refresh(activity)
@@ -401,9 +403,9 @@ def batch_update_classification(
         activity.manually_classified = True
         
         # Recalculate TRIMP if applicable
-        if activity.include_in_training_load and activity.average_heartrate:
+        if activity.include_in_training_load:
             activity.trimp_score = metrics_service.calculate_trimp(activity, user)
-        elif not activity.include_in_training_load:
+        else:
             activity.trimp_score = None
             
         updated_count += 1
@@ -1,7 +1,8 @@
 import os
 import json
 import time
-from typing import List, Dict, Any, Optional, Union
+import asyncio
+from typing import List, Dict, Any, Optional, Union, Tuple, AsyncIterator
 from google import genai
 from google.genai import types
 
@@ -9,6 +10,10 @@ from app.config import get_settings
 
 settings = get_settings()
 
+_PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts")
+# Prompt templates read from _PROMPTS_DIR, by name
+_PROMPT_FILES: Dict[str, str] = {}
+
 class GeminiProvider:
     """Gemini 3 provider using the new google-genai SDK."""
     
@@ -82,22 +87,35 @@ Format JSON attendu:
 """
         }
         
+    def has_prompt(self, prompt_name: str) -> bool:
+        return bool(self.prompts.get(prompt_name))
+
     def load_prompt(self, prompt_name: str) -> str:
         return self.prompts.get(prompt_name, "")
 
-    async def complete(
-        self,
-        prompt: str,
-        messages: List[Dict[str, Any]] = None,
-        model: str = "flash",
-        temperature: float = 0.7,
-        max_tokens: int = 2000,
-        thinking_level: str = "off",
-    ) -> Dict[str, Any]:
+    async def warmup(self, model: str = "flash") -> None:
         """
-        Generate completion using Gemini 3 (google-genai SDK).
+        Open the API connection (TLS, auth) ahead of the first real request.
+        
+        Uses a cheap model metadata lookup on the same client/connection pool.
         """
         model_id = "gemini-3-flash-preview" if model == "flash" else "gemini-3-pro-preview"
+        try:
+            await self.client.aio.models.get(model=model_id)
+        except Exception as e:
+            print(f"Gemini warmup failed: {e}")
+
+    def _build_request(
+        self,
+        prompt: str,
+        messages: Optional[List[Union[Dict[str, Any], types.Content]]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        thinking_level: str,
+    ) -> Tuple[str, List[types.Content], types.GenerateContentConfig]:
+        """Model id, contents and config shared by complete() and stream()."""
+        model_id = "gemini-3-flash-preview" if model == "flash" else "gemini-3-pro-preview"
         
         # Configure Generation Params
         config = types.GenerateContentConfig(
@@ -116,6 +134,10 @@ Format JSON attendu:
         if messages:
             # Convert history to new SDK Types
             for m in messages:
+                # Already an SDK Content (e.g. prebuilt history): use as-is
+                if isinstance(m, types.Content):
+                    contents.append(m)
+                    continue
                 # Map old structure to new
                 role = "user" if m.get("role") == "user" else "model"
                 parts = []
@@ -141,6 +163,24 @@ Format JSON attendu:
                 parts=[types.Part.from_text(text=prompt)]
             )
         )
+        
+        return model_id, contents, config
+
+    async def complete(
+        self,
+        prompt: str,
+        messages: List[Union[Dict[str, Any], types.Content]] = None,
+        model: str = "flash",
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        thinking_level: str = "off",
+    ) -> Dict[str, Any]:
+        """
+        Generate completion using Gemini 3 (google-genai SDK).
+        """
+        model_id, contents, config = self._build_request(
+            prompt, messages, model, temperature, max_tokens, thinking_level
+        )
             
         try:
             # Generate using asyncio client
@@ -203,6 +243,41 @@ Format JSON attendu:
                      raise retry_e
             raise e
 
+    async def stream(
+        self,
+        prompt: str,
+        messages: List[Union[Dict[str, Any], types.Content]] = None,
+        model: str = "flash",
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        thinking_level: str = "off",
+    ) -> AsyncIterator[str]:
+        """
+        Stream the completion text as it is generated (thought parts are skipped).
+        
+        Closing the iterator early (break + aclose) closes the HTTP response,
+        so callers that only need a prefix of the answer stop paying for the rest.
+        """
+        model_id, contents, config = self._build_request(
+            prompt, messages, model, temperature, max_tokens, thinking_level
+        )
+        
+        async for chunk in await self.client.aio.models.generate_content_stream(
+            model=model_id,
+            contents=contents,
+            config=config,
+        ):
+            if not chunk.candidates:
+                continue
+            cand = chunk.candidates[0]
+            if not cand.content or not cand.content.parts:
+                continue
+            for part in cand.content.parts:
+                if getattr(part, "thought", None):
+                    continue
+                if part.text:
+                    yield part.text
+
     async def complete_json(
         self,
         prompt: str,
@@ -336,6 +411,96 @@ Format JSON attendu:
             print(f"Stream Error: {e}")
             yield {"type": "error", "content": str(e)}
 
+# Appended to the classification prompt when {activity_json} holds a list
+_CLASSIFY_BATCH_INSTRUCTIONS = """
+
+## Batch Mode
+
+The activity data above is a JSON array of {count} activities.
+Respond with a JSON array of exactly {count} objects, one per activity and
+in the same order, each using the response format described above."""
+
+
 class LLMService:
+    # Activities per classification request
+    CLASSIFY_BATCH_SIZE = 20
+    # Length of Activity.classification_reasoning (String(500))
+    CLASSIFY_REASONING_MAX_CHARS = 500
+    
     def __init__(self):
         self.provider = GeminiProvider()
+    
+    @staticmethod
+    def _load_prompt_file(name: str) -> str:
+        """Read a prompt template from app/prompts (cached after first read)."""
+        if name not in _PROMPT_FILES:
+            with open(os.path.join(_PROMPTS_DIR, f"{name}.txt"), encoding="utf-8") as f:
+                _PROMPT_FILES[name] = f.read()
+        return _PROMPT_FILES[name]
+    
+    async def classify_activity(self, activity_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Classify a single activity (workout / commute / recovery / race)."""
+        prompt = self._load_prompt_file("classify_activity").replace(
+            "{activity_json}",
+            json.dumps(activity_data, ensure_ascii=False, indent=2, default=str),
+        )
+        result = await self.provider.complete_json(prompt, model="flash", temperature=0.1)
+        if not isinstance(result, dict) or "classification" not in result:
+            raise ValueError("Invalid classification response")
+        return self._fit_classification(result)
+    
+    @classmethod
+    def _fit_classification(cls, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Cap the model's free-text reasoning to what the activity column holds."""
+        result["reasoning"] = str(result.get("reasoning") or "")[:cls.CLASSIFY_REASONING_MAX_CHARS]
+        return result
+    
+    async def classify_activities_batch(
+        self, inputs: List[Dict[str, Any]]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        Classify many activities with one LLM request per CLASSIFY_BATCH_SIZE.
+        
+        Returns one result per input, in order; None where classification failed.
+        A batch whose response cannot be matched back to its inputs is retried
+        one activity at a time.
+        """
+        chunks = [
+            inputs[i:i + self.CLASSIFY_BATCH_SIZE]
+            for i in range(0, len(inputs), self.CLASSIFY_BATCH_SIZE)
+        ]
+        chunk_results = await asyncio.gather(*[self._classify_chunk(c) for c in chunks])
+        return [result for chunk in chunk_results for result in chunk]
+    
+    async def _classify_chunk(
+        self, chunk: List[Dict[str, Any]]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Classify one batch, falling back to per-activity requests."""
+        if len(chunk) > 1:
+            prompt = self._load_prompt_file("classify_activity").replace(
+                "{activity_json}",
+                json.dumps(chunk, ensure_ascii=False, default=str),
+            ) + _CLASSIFY_BATCH_INSTRUCTIONS.format(count=len(chunk))
+            
+            try:
+                results = await self.provider.complete_json(prompt, model="flash", temperature=0.1)
+            except Exception as e:
+                print(f"Batch classification error: {e}")
+                results = None
+            
+            if (
+                isinstance(results, list)
+                and len(results) == len(chunk)
+                and all(isinstance(r, dict) and "classification" in r for r in results)
+            ):
+                return [self._fit_classification(r) for r in results]
+        
+        # Single-item fallback
+        results = []
+        for activity_data in chunk:
+            try:
+                results.append(await self.classify_activity(activity_data))
+            except Exception as e:
+                print(f"Classification error: {e}")
+                results.append(None)
+        return results
@@ -1,12 +1,103 @@
 """Training metrics calculation service - TRIMP, ACWR, CTL/ATL/TSB."""
 
 from sqlalchemy.orm import Session
-from datetime import date, timedelta, datetime
+from sqlalchemy import Date, func
+from datetime import date, timedelta, datetime, time
 import math
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Dict, List, Mapping, Tuple
 
 from app.models import Activity, User
 from app.schemas import TrainingMetrics, FitnessHistory
 
+# Banister TRIMP coefficients (male): k and y-intercept
+_K_MALE = 1.92
+_YI_MALE = 0.64
+
+# TRIMP-per-minute multipliers by activity type when no HR data is available
+_TRIMP_NO_HR_MULTIPLIERS = {
+    "Run": 1.2,
+    "Ride": 0.8,
+    "Swim": 1.0,
+    "Walk": 0.5,
+    "Hike": 0.7,
+    "Workout": 1.0,
+}
+_TRIMP_NO_HR_DEFAULT = 0.8
+
+# HR defaults when the user has not set them, and the HR reserve used when
+# the settings give a non-positive one
+_DEFAULT_RESTING_HR = 60
+_DEFAULT_MAX_HR = 190
+_DEFAULT_HR_RANGE = 130
+
+# ACWR training zones (Gabbett et al., optimal 0.8 - 1.3). Zone upper bounds
+# are inclusive, so zones are looked up with bisect_left; the first bound is
+# nudged just below 0.8 so that exactly 0.8 still lands in "optimal".
+_ACWR_ZONE_BOUNDS = (math.nextafter(0.8, 0.0), 1.3, 1.5)
+_ACWR_ZONES = ("detraining", "optimal", "overreaching", "danger")
+
+# EMA weights for CTL (42-day) and ATL (7-day) time constants:
+# EMA_today = EMA_yesterday * (1 - 1/T) + Val_today * (1/T)
+_CTL_DECAY = 41.0 / 42.0
+_CTL_ALPHA = 1.0 / 42.0
+_ATL_DECAY = 6.0 / 7.0
+_ATL_ALPHA = 1.0 / 7.0
+
+
+def _hr_constants(user: User) -> Tuple[float, float]:
+    """Resting HR and HR reserve (max - rest) for the TRIMP formula, with defaults."""
+    hr_rest = user.resting_heart_rate or _DEFAULT_RESTING_HR
+    hr_max = user.max_heart_rate or _DEFAULT_MAX_HR
+    
+    # Prevent division by zero or negative values
+    hr_range = hr_max - hr_rest
+    if hr_range <= 0:
+        hr_range = _DEFAULT_HR_RANGE
+    return hr_rest, hr_range
+
+
+def _trimp(row: Mapping[str, Any], hr_rest: float, hr_range: float) -> float:
+    """
+    TRIMP for one activity given as column values (moving_time,
+    average_heartrate, activity_type) and the user's resolved HR constants.
+    
+    The only implementation of the formula; see MetricsService.calculate_trimp.
+    """
+    duration_min = row["moving_time"] / 60
+    hr_avg = row.get("average_heartrate")
+    
+    if not hr_avg:
+        # No HR data, estimate based on activity type and duration
+        multiplier = _TRIMP_NO_HR_MULTIPLIERS.get(row.get("activity_type"), _TRIMP_NO_HR_DEFAULT)
+        return round(duration_min * multiplier, 1)
+    
+    hr_ratio = (hr_avg - hr_rest) / hr_range
+    hr_ratio = max(0, min(hr_ratio, 1))  # Clamp between 0 and 1
+    
+    return round(duration_min * hr_ratio * _YI_MALE * math.exp(_K_MALE * hr_ratio), 1)
+
+
+def _ema_sweep(
+    daily_trimp: List[float], ctl: float = 0.0, atl: float = 0.0
+) -> Tuple[List[float], List[float]]:
+    """
+    Run the CTL (42-day) and ATL (7-day) EMAs over consecutive daily TRIMP values.
+    
+    Pure numeric loop with no DB or date handling, starting from the given
+    seed values. Returns the (ctl, atl) value for each day.
+    """
+    ctl_values = []
+    atl_values = []
+    for trimp in daily_trimp:
+        # Coggan's formula: EMA_today = EMA_yesterday + (Val_today - EMA_yesterday) / Time_Constant
+        ctl = ctl * _CTL_DECAY + trimp * _CTL_ALPHA
+        atl = atl * _ATL_DECAY + trimp * _ATL_ALPHA
+        ctl_values.append(ctl)
+        atl_values.append(atl)
+    return ctl_values, atl_values
+
 
 class MetricsService:
     """Service for calculating training load metrics."""
@@ -25,84 +116,60 @@ class MetricsService:
         - Male: k = 1.92, y-intercept = 0.64
         - Female: k = 1.67, y-intercept = 0.86
         """
-        if not activity.average_heartrate:
-            # No HR data, estimate based on activity type and duration
-            return self._estimate_trimp_no_hr(activity)
-        
-        hr_rest = user.resting_heart_rate or 60
-        hr_max = user.max_heart_rate or 190
-        hr_avg = activity.average_heartrate
-        
-        # Prevent division by zero or negative values
-        hr_range = hr_max - hr_rest
-        if hr_range <= 0:
-            hr_range = 130  # Default range
-        
-        hr_ratio = (hr_avg - hr_rest) / hr_range
-        hr_ratio = max(0, min(hr_ratio, 1))  # Clamp between 0 and 1
-        
-        duration_min = activity.moving_time / 60
-        
-        # Male coefficients
-        k = 1.92
-        y_intercept = 0.64
-        
-        trimp = duration_min * hr_ratio * y_intercept * math.exp(k * hr_ratio)
-        
-        return round(trimp, 1)
+        return _trimp(
+            {
+                "moving_time": activity.moving_time,
+                "average_heartrate": activity.average_heartrate,
+                "activity_type": activity.activity_type,
+            },
+            *_hr_constants(user),
+        )
     
-    def _estimate_trimp_no_hr(self, activity: Activity) -> float:
-        """Estimate TRIMP when no HR data is available."""
-        duration_min = activity.moving_time / 60
-        
-        # Base multipliers by activity type
-        multipliers = {
-            "Run": 1.2,
-            "Ride": 0.8,
-            "Swim": 1.0,
-            "Walk": 0.5,
-            "Hike": 0.7,
-            "Workout": 1.0,
-        }
-        
-        multiplier = multipliers.get(activity.activity_type, 0.8)
+    def calculate_trimp_batch(self, rows: List[Mapping[str, Any]], user: User) -> List[float]:
+        """
+        Calculate TRIMP for many activities of the same user, given as
+        column-value dicts (e.g. rows about to be bulk-inserted).
         
-        # Simple estimate: duration * multiplier
-        return round(duration_min * multiplier, 1)
+        Same values as calculate_trimp, in input order, with the user's HR
+        constants resolved once for the whole batch.
+        """
+        hr_rest, hr_range = _hr_constants(user)
+        return [_trimp(row, hr_rest, hr_range) for row in rows]
     
     def get_daily_trimp(self, user: User, target_date: date) -> float:
         """Get total TRIMP for a specific date."""
-        activities = (
-            self.db.query(Activity)
+        # start_date is a DateTime column: compare against datetimes so the
+        # planner can use the start_date index with a half-open interval.
+        start_dt = datetime.combine(target_date, time.min)
+        end_dt = start_dt + timedelta(days=1)
+        
+        return (
+            self.db.query(func.coalesce(func.sum(Activity.trimp_score), 0.0))
             .filter(
                 Activity.user_id == user.id,
                 Activity.include_in_training_load == True,
-                Activity.start_date >= target_date,
-                Activity.start_date < target_date + timedelta(days=1),
+                Activity.start_date >= start_dt,
+                Activity.start_date < end_dt,
             )
-            .all()
+            .scalar()
         )
-        
-        return sum(a.trimp_score or 0 for a in activities)
     
     def calculate_acute_load(self, user: User, as_of_date: date = None) -> float:
-        """Calculate acute (7-day) training load."""
+        """Calculate acute (7-day) training load: the 7 days ending with as_of_date."""
         as_of_date = as_of_date or date.today()
-        start_date = as_of_date - timedelta(days=7)
+        end_dt = datetime.combine(as_of_date, time.min) + timedelta(days=1)
+        start_dt = end_dt - timedelta(days=7)
         
-        activities = (
-            self.db.query(Activity)
+        return (
+            self.db.query(func.coalesce(func.sum(Activity.trimp_score), 0.0))
             .filter(
                 Activity.user_id == user.id,
                 Activity.include_in_training_load == True,
-                Activity.start_date >= start_date,
-                Activity.start_date <= as_of_date,
+                Activity.start_date >= start_dt,
+                Activity.start_date < end_dt,
             )
-            .all()
+            .scalar()
         )
-        
-        return sum(a.trimp_score or 0 for a in activities)
-    
     
     def calculate_rolling_metrics(self, user: User, start_date: date, end_date: date) -> dict:
         """
@@ -115,51 +182,74 @@ class MetricsService:
         # We need 180 days prior to start_date to stabilize CTL
         init_start_date = start_date - timedelta(days=180)
         
-        activities = (
-            self.db.query(Activity)
+        # Half-open datetime bounds so the whole end_date is included
+        start_dt = datetime.combine(init_start_date, time.min)
+        end_dt = datetime.combine(end_date, time.min) + timedelta(days=1)
+        
+        # Only the two columns used below, streamed as plain rows
+        rows = (
+            self.db.query(Activity.start_date, Activity.trimp_score)
             .filter(
                 Activity.user_id == user.id,
                 Activity.include_in_training_load == True,
-                Activity.start_date >= init_start_date,
-                Activity.start_date <= end_date,
+                Activity.start_date >= start_dt,
+                Activity.start_date < end_dt,
             )
-            .all()
+            .yield_per(1000)
         )
         
-        # Map activities to dates for fast lookup
-        daily_stress = {}
-        for activity in activities:
-            d = activity.start_date.date() if isinstance(activity.start_date, datetime) else activity.start_date
-            daily_stress[d] = daily_stress.get(d, 0) + (activity.trimp_score or 0)
+        # Map activities to day ordinals for fast lookup
+        daily_stress = defaultdict(float)
+        for start, trimp_score in rows:
+            daily_stress[start.toordinal()] += trimp_score or 0.0
             
-        # Initialize metrics
+        return self._rolling_from_daily_stress(daily_stress, start_date, end_date)
+    
+    def _rolling_from_daily_stress(
+        self, daily_stress: Dict[int, float], start_date: date, end_date: date
+    ) -> dict:
+        """
+        Run the CTL/ATL/TSB EMAs over a day-ordinal -> TRIMP map for a date range.
+        
+        Days are handled as integer ordinals (date.toordinal()); date objects
+        are only built for the emitted result keys.
+        """
+        start_ord = start_date.toordinal()
+        n_days = (end_date - start_date).days + 1
+        
+        if not daily_stress:
+            # No training in the whole window: every EMA is zero, skip the sweep
+            return {
+                date.fromordinal(start_ord + i): {"ctl": 0.0, "atl": 0.0, "tsb": 0.0}
+                for i in range(n_days)
+            }
+        
+        # Seed the EMAs at the day before start_date from the warmup days in
+        # closed form: EMA_t = sum_k (1/T) * (1 - 1/T)^k * Val_(t-k).
+        # Identical to stepping through every warmup day from zero, but only
+        # visits days that actually have activities.
         ctl = 0.0
         atl = 0.0
+        for d_ord, stress in daily_stress.items():
+            if d_ord < start_ord:
+                age = start_ord - d_ord - 1
+                ctl += stress * _CTL_ALPHA * _CTL_DECAY ** age
+                atl += stress * _ATL_ALPHA * _ATL_DECAY ** age
         
-        results = {}
-        
-        # Iterate through every single day to calculate rolling averages
+        # Sweep the EMAs over every requested day
         # (EMA must be calculated sequentially day-by-day)
-        curr = init_start_date
-        while curr <= end_date:
-            trimp = daily_stress.get(curr, 0)
-            
-            # Coggan's formula: EMA_today = EMA_yesterday + (Val_today - EMA_yesterday) / Time_Constant
-            ctl = ctl + (trimp - ctl) / 42.0
-            atl = atl + (trimp - atl) / 7.0
-            tsb = ctl - atl
-            
-            # Store only requested range
-            if curr >= start_date:
-                results[curr] = {
-                    "ctl": round(ctl, 1),
-                    "atl": round(atl, 1),
-                    "tsb": round(tsb, 1)
-                }
-            
-            curr += timedelta(days=1)
-            
-        return results
+        ctl_values, atl_values = _ema_sweep(
+            [daily_stress.get(start_ord + i, 0.0) for i in range(n_days)], ctl, atl
+        )
+        
+        return {
+            date.fromordinal(start_ord + i): {
+                "ctl": round(ctl, 1),
+                "atl": round(atl, 1),
+                "tsb": round(ctl - atl, 1),
+            }
+            for i, (ctl, atl) in enumerate(zip(ctl_values, atl_values))
+        }
 
     def get_current_metrics(self, user: User) -> TrainingMetrics:
         """Get all current training metrics with safe ACWR."""
@@ -186,22 +276,14 @@ class MetricsService:
         
         # Refined Zones based on Gabbett et al. (Optimal: 0.8 - 1.3)
         # We add tolerance for "Form Building" if absolute load is low
-        if acwr < 0.8:
-            zone = "detraining"
-        elif acwr <= 1.3:
-            zone = "optimal"
-        elif acwr <= 1.5:
+        zone_idx = bisect_left(_ACWR_ZONE_BOUNDS, acwr)
+        zone = _ACWR_ZONES[zone_idx]
+        if zone_idx == 2 and auth_atl < 30:
             # If absolute acute load is low (< 30), high ACWR is just "getting moving", not dangerous overload
-            if auth_atl < 30:
-                zone = "optimal" # Override for low volume
-            else:
-                zone = "overreaching"
-        else:
-            # Dangerous spikes
-            if auth_atl < 40:
-                zone = "caution" # Lower alert for low volume spikes
-            else:
-                zone = "danger"
+            zone = "optimal" # Override for low volume
+        elif zone_idx == 3 and auth_atl < 40:
+            # Dangerous spikes on low volume get a lower alert
+            zone = "caution"
         
         return TrainingMetrics(
             date=today,
@@ -220,7 +302,55 @@ class MetricsService:
         start_date = end_date - timedelta(days=days)
         
         metrics_map = self.calculate_rolling_metrics(user, start_date, end_date)
+        return self._to_fitness_history(metrics_map)
+    
+    def get_fitness_history_bulk(
+        self, user_ids: List[int], days: int = 90
+    ) -> Dict[int, FitnessHistory]:
+        """
+        Get CTL/ATL/TSB history for several users with a single DB query.
+        
+        Daily TRIMP is aggregated per (user, day) in SQL, then each user's
+        EMAs are computed from that map. Returns a dict user_id -> FitnessHistory.
+        """
+        end_date = date.today()
+        start_date = end_date - timedelta(days=days)
+        init_start_date = start_date - timedelta(days=180)
+        
+        start_dt = datetime.combine(init_start_date, time.min)
+        end_dt = datetime.combine(end_date, time.min) + timedelta(days=1)
+        
+        # Typed so every backend hands back date objects (SQLite returns strings)
+        day = func.date(Activity.start_date, type_=Date)
+        rows = (
+            self.db.query(
+                Activity.user_id,
+                day,
+                func.coalesce(func.sum(Activity.trimp_score), 0.0),
+            )
+            .filter(
+                Activity.user_id.in_(user_ids),
+                Activity.include_in_training_load == True,
+                Activity.start_date >= start_dt,
+                Activity.start_date < end_dt,
+            )
+            .group_by(Activity.user_id, day)
+            .all()
+        )
         
+        stress_by_user = {user_id: {} for user_id in user_ids}
+        for user_id, d, trimp in rows:
+            stress_by_user[user_id][d.toordinal()] = float(trimp)
+        
+        return {
+            user_id: self._to_fitness_history(
+                self._rolling_from_daily_stress(daily_stress, start_date, end_date)
+            )
+            for user_id, daily_stress in stress_by_user.items()
+        }
+    
+    def _to_fitness_history(self, metrics_map: dict) -> FitnessHistory:
+        """Convert a date -> {ctl, atl, tsb} map into a FitnessHistory."""
         dates = []
         ctl_values = []
         atl_values = []
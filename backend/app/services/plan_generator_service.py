@@ -1,16 +1,111 @@
 """AI-powered training plan generator service with activity-aware planning."""
 
+import asyncio
+import hashlib
 import json
-from datetime import date, timedelta
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, case, and_, insert
 
 from app.models import User, RaceGoal, PlannedSession, Activity
 from app.services.llm_service import LLMService
 from app.services.metrics_service import MetricsService
 from app.services.strava_service import StravaService
 
+# Zero-padded seconds "00".."59" for pace formatting
+_PAD2 = tuple(f"{i:02d}" for i in range(60))
+
+_WEEKDAY_NAMES_FR = ("Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche")
+
+_PHASE_FOCUSES = {
+    "build": "Construction de l'endurance aérobie",
+    "peak": "Travail spécifique et intensité maximale",
+    "taper": "Récupération et fraîcheur pour le jour J",
+}
+
+# Session titles and default descriptions, filled with str.format per session
+_SESSION_TITLES = {
+    "easy": "Footing tranquille - S{week_num}",
+    "long": "Sortie longue - S{week_num}",
+    "tempo": "Tempo/Allure seuil - S{week_num}",
+    "interval": "Fractionné - S{week_num}",
+    "recovery": "Récupération active - S{week_num}",
+    "rest": "Repos - S{week_num}",
+    "cross": "Cross-training - S{week_num}",
+}
+_SESSION_DESCRIPTIONS = {
+    "easy": "Course facile de {duration}min à {pace}. Respiration aisée.",
+    "long": "Sortie longue de {duration}min à {pace}. Restez hydraté.",
+    "tempo": "Échauffement 10min, {tempo_main}min à {pace}, retour calme 10min.",
+    "interval": "15min échauffement + séries de fractionné + 10min retour calme.",
+    "recovery": "Footing très léger de {duration}min pour la récupération.",
+    "rest": "Jour de repos complet. Étirements légers si souhaité.",
+    "cross": "{duration} minutes de vélo, natation ou autre activité sans impact.",
+}
+
+# Fallback-plan workout instructions, filled with str.format per session
+_LONG_RUN_DETAILS = (
+    "Sortie longue de {duration} minutes à allure confortable. "
+    "Objectif: {pace}. "
+    "Prenez de l'eau et éventuellement un gel si > 75min."
+)
+_RECOVERY_DETAILS = (
+    "Récupération active de {duration} minutes. "
+    "Allure très facile: {pace}. "
+    "Prépare les jambes pour la sortie longue."
+)
+_TEMPO_DETAILS = (
+    "Échauffement 10min, puis {tempo_duration}min à allure seuil "
+    "({pace}), "
+    "puis 10min de retour calme. Effort soutenu mais contrôlé."
+)
+_EASY_DETAILS = (
+    "Footing tranquille de {duration} minutes à "
+    "{pace}. "
+    "Respiration facile, capable de tenir une conversation."
+)
+
+# LLM plans keyed by a hash of the rendered prompt (see _plan_cache_key).
+# In-process only; entries expire after a day and the oldest are evicted first.
+_PLAN_CACHE: Dict[str, Dict[str, Any]] = {}
+_PLAN_CACHE_MAX_ENTRIES = 1000
+_PLAN_CACHE_TTL = timedelta(hours=24)
+
+
+@dataclass(slots=True, frozen=True)
+class SessionSpec:
+    """A single planned session, before it is dated and persisted."""
+    
+    day: int
+    session_type: str
+    duration_minutes: int
+    intensity: str
+    pace_per_km: Optional[int]
+    terrain_type: str
+    elevation_gain: int
+    intervals: Optional[list]
+    workout_details: str
+    description: Optional[str] = None
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionSpec":
+        """Build a spec from an LLM-generated session, filling in defaults."""
+        return cls(
+            day=data.get("day", 1),
+            session_type=data.get("session_type", "easy"),
+            duration_minutes=data.get("duration_minutes", 45),
+            intensity=data.get("intensity", "easy"),
+            pace_per_km=data.get("pace_per_km"),
+            terrain_type=data.get("terrain_type", "road"),
+            elevation_gain=data.get("elevation_gain", 0),
+            intervals=data.get("intervals"),
+            workout_details=data.get("workout_details", ""),
+            description=data.get("description"),
+        )
+
 
 class PlanGeneratorService:
     """Service for generating training plans using AI with activity-aware context."""
@@ -34,7 +129,7 @@ class PlanGeneratorService:
         "recovery": 1.35,  # 35% slower
     }
     
-    SESSION_TYPES = [
+    SESSION_TYPES = (
         "easy",        # Easy/recovery run
         "long",        # Long run
         "tempo",       # Tempo/threshold run
@@ -42,7 +137,7 @@ class PlanGeneratorService:
         "recovery",    # Active recovery
         "rest",        # Rest day
         "cross",       # Cross-training
-    ]
+    )
     
     def __init__(self, db: Session):
         self.db = db
@@ -54,21 +149,58 @@ class PlanGeneratorService:
         """Build a profile of the user's recent training history."""
         since = date.today() - timedelta(days=days)
         
-        activities = (
-            self.db.query(Activity)
-            .filter(
-                Activity.user_id == user.id,
-                Activity.start_date >= since,
-                Activity.activity_type.in_(["Run", "Trail Run", "Track", "Ride", "VirtualRide"])
+        filters = (
+            Activity.user_id == user.id,
+            Activity.start_date >= since,
+            Activity.activity_type.in_(["Run", "Trail Run", "Track", "Ride", "VirtualRide"]),
+        )
+        
+        is_run = Activity.activity_type == "Run"
+        is_paced = and_(Activity.distance > 0, Activity.moving_time > 0)
+        is_commute = and_(
+            Activity.activity_type.in_(["Ride", "VirtualRide"]),
+            Activity.distance < 15000,
+            Activity.moving_time < 2400,  # < 40 mins
+        )
+        run_pace = Activity.moving_time / (Activity.distance / 1000.0)  # seconds per km
+        
+        # Aggregate volume, pace, HR and records in a single round-trip
+        stats_query = (
+            self.db.query(
+                func.count(Activity.id).label("count"),
+                func.coalesce(func.sum(Activity.distance), 0).label("total_distance"),
+                func.coalesce(func.sum(Activity.moving_time), 0).label("total_time"),
+                func.sum(case((is_paced, Activity.moving_time))).label("paced_time"),
+                func.sum(case((is_paced, Activity.distance))).label("paced_distance"),
+                func.max(Activity.max_heartrate).label("max_hr"),
+                func.avg(
+                    case((and_(is_run, Activity.average_heartrate > 0), Activity.average_heartrate))
+                ).label("avg_hr_run"),
+                func.min(case((and_(is_run, Activity.distance >= 5000), run_pace))).label("best_5k_pace"),
+                func.min(case((and_(is_run, Activity.distance >= 10000), run_pace))).label("best_10k_pace"),
+                func.count(case((is_commute, Activity.id))).label("commute_count"),
+                func.max(case((is_run, Activity.start_date))).label("last_run_date"),
             )
-            .all()
+            .filter(*filters)
         )
+        
+        # Fetch Strava Global Stats (Career totals) in the background, started
+        # before the aggregate runs. The query blocks the event loop (the session
+        # is sync and not thread-safe), so the overlap is limited to the part of
+        # the request the task sends before it.
+        strava_stats_task = asyncio.create_task(self.strava_service.get_athlete_stats(user))
+        await asyncio.sleep(0)
+        try:
+            stats = stats_query.one()
+        except BaseException:
+            # Don't leave the request running (or its error unretrieved)
+            strava_stats_task.cancel()
+            raise
 
-        # Fetch Strava Global Stats (Career totals)
-        strava_stats = await self.strava_service.get_athlete_stats(user)
+        strava_stats = await strava_stats_task
         all_run_totals = strava_stats.get("all_run_totals", {})
         
-        if not activities and not all_run_totals:
+        if not stats.count and not all_run_totals:
             return {
                 "has_history": False,
                 "weekly_volume_km": 0,
@@ -82,34 +214,26 @@ class PlanGeneratorService:
             }
         
         # Calculate stats
-        total_distance = sum(a.distance for a in activities)
-        total_time = sum(a.moving_time for a in activities)
+        total_distance = stats.total_distance
+        total_time = stats.total_time
         weeks = max(1, days / 7)
         
         # Find longest run
-        if activities:
-            longest_run = max(activities, key=lambda a: a.distance)
-        else:
-            longest_run = None
+        longest_run = (
+            self.db.query(Activity.distance, Activity.start_date)
+            .filter(*filters)
+            .order_by(Activity.distance.desc().nullslast())
+            .first()
+        )
         
-        # Calculate average pace (seconds per km)
+        # Calculate average pace (seconds per km), weighted by distance
         avg_pace = None
-        paced_activities = [a for a in activities if a.distance > 0 and a.moving_time > 0]
-        if paced_activities:
-            total_pace_weighted = sum((a.moving_time / (a.distance / 1000)) * a.distance for a in paced_activities)
-            total_weight = sum(a.distance for a in paced_activities)
-            avg_pace = int(total_pace_weighted / total_weight) if total_weight > 0 else None
+        if stats.paced_distance:
+            avg_pace = int(stats.paced_time * 1000 / stats.paced_distance)
 
         # Physiological Analysis (Heart Rate)
-        max_hr_observed = 0
-        avg_hrs = []
-        for a in activities:
-            if a.max_heartrate:
-                max_hr_observed = max(max_hr_observed, a.max_heartrate)
-            if a.average_heartrate and a.activity_type == "Run":
-                avg_hrs.append(a.average_heartrate)
-        
-        avg_hr_run = int(sum(avg_hrs) / len(avg_hrs)) if avg_hrs else None
+        max_hr_observed = stats.max_hr or 0
+        avg_hr_run = int(stats.avg_hr_run) if stats.avg_hr_run else None
         
         physiology = {
             "resting_hr": user.resting_heart_rate,
@@ -119,48 +243,50 @@ class PlanGeneratorService:
             "hr_reserve": (user.max_heart_rate - user.resting_heart_rate) if user.max_heart_rate and user.resting_heart_rate else None
         }
 
-        # Calculate VMA / Best performances
-        best_5k = min((a for a in activities if a.distance >= 5000 and a.activity_type == "Run"), 
-                     key=lambda x: x.moving_time / (x.distance/1000), default=None)
-        best_10k = min((a for a in activities if a.distance >= 10000 and a.activity_type == "Run"), 
-                      key=lambda x: x.moving_time / (x.distance/1000), default=None)
+        # Calculate VMA / Best performances (best paces in seconds per km)
+        best_5k_pace = stats.best_5k_pace
+        best_10k_pace = stats.best_10k_pace
         
         estimated_vma = None
-        if best_10k:
-            pace_10k = (best_10k.moving_time / 60) / (best_10k.distance / 1000) # min/km
-            speed_10k = 60 / pace_10k # km/h
+        if best_10k_pace:
+            speed_10k = 3600 / best_10k_pace # km/h
             estimated_vma = speed_10k * 1.05 # Rough estimate: 10km is ~90-95% VMA
-        elif best_5k:
-             pace_5k = (best_5k.moving_time / 60) / (best_5k.distance / 1000)
-             speed_5k = 60 / pace_5k
+        elif best_5k_pace:
+             speed_5k = 3600 / best_5k_pace
              estimated_vma = speed_5k * 1.10
              
         # Records Context
         records = {
             "estimated_vma": round(estimated_vma, 1) if estimated_vma else None,
-            "best_5k_recent": self._format_pace(int(best_5k.moving_time / (best_5k.distance/1000))) if best_5k else None,
-            "best_10k_recent": self._format_pace(int(best_10k.moving_time / (best_10k.distance/1000))) if best_10k else None,
+            "best_5k_recent": self._format_pace(int(best_5k_pace)) if best_5k_pace else None,
+            "best_10k_recent": self._format_pace(int(best_10k_pace)) if best_10k_pace else None,
             "career_total_km": int(all_run_totals.get("distance", 0) / 1000) if all_run_totals else 0,
             "career_total_runs": all_run_totals.get("count", 0) if all_run_totals else 0
         }
 
         # Commute Analysis (Vélotaff)
-        bike_commutes = [
-            a for a in activities 
-            if a.activity_type in ["Ride", "VirtualRide"] 
-            and a.distance < 15000 
-            and a.moving_time < 2400 # < 40 mins
-        ]
-        commute_count = len(bike_commutes)
+        commute_count = stats.commute_count
         
         # Gap analysis
         days_since_last_run = 0
-        last_run = max((a for a in activities if a.activity_type == "Run"), key=lambda x: x.start_date, default=None)
-        if last_run:
-            days_since_last_run = (date.today() - last_run.start_date.date()).days
+        if stats.last_run_date:
+            days_since_last_run = (date.today() - stats.last_run_date.date()).days
         
         # Get recent activity summaries for LLM context
-        recent = sorted(activities, key=lambda a: a.start_date, reverse=True)[:10]
+        recent = (
+            self.db.query(
+                Activity.start_date,
+                Activity.activity_type,
+                Activity.distance,
+                Activity.moving_time,
+                Activity.average_heartrate,
+                Activity.total_elevation_gain,
+            )
+            .filter(*filters)
+            .order_by(Activity.start_date.desc())
+            .limit(10)
+            .all()
+        )
         recent_summaries = [
             {
                 "date": a.start_date.isoformat() if a.start_date else None,
@@ -176,11 +302,11 @@ class PlanGeneratorService:
         
         return {
             "has_history": True,
-            "total_activities": len(activities),
+            "total_activities": stats.count,
             "period_days": days,
             "weekly_volume_km": round(total_distance / 1000 / weeks, 1),
             "weekly_hours": round(total_time / 3600 / weeks, 1),
-            "runs_per_week": round(len(activities) / weeks, 1),
+            "runs_per_week": round(stats.count / weeks, 1),
             "longest_run_km": round(longest_run.distance / 1000, 1) if longest_run else 0,
             "longest_run_date": longest_run.start_date.isoformat() if longest_run and longest_run.start_date else None,
             "avg_pace_per_km": avg_pace,
@@ -194,27 +320,33 @@ class PlanGeneratorService:
             "recent_activities": recent_summaries,
         }
     
-    def _calculate_target_paces(self, goal: RaceGoal) -> Dict[str, int]:
-        """Calculate target paces for different session types based on goal time."""
-        if not goal.target_time_seconds:
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _race_targets(
+        race_type: str, distance_km: Optional[float], target_time_seconds: Optional[int]
+    ) -> Tuple[float, Tuple[Tuple[str, int], ...]]:
+        """Race distance and per-session-type target paces for a goal's race parameters."""
+        distance = PlanGeneratorService.RACE_DISTANCES.get(race_type, distance_km or 10)
+        
+        if not target_time_seconds:
             # Default paces if no target time (5:30/km base)
             base_pace = 330  # seconds per km
         else:
-            distance = self.RACE_DISTANCES.get(goal.race_type, goal.distance_km or 10)
-            base_pace = int(goal.target_time_seconds / distance)  # Race pace
+            base_pace = int(target_time_seconds / distance)  # Race pace
         
-        return {
-            session_type: int(base_pace * multiplier)
-            for session_type, multiplier in self.PACE_ZONES.items()
-        }
+        paces = tuple(
+            (session_type, int(base_pace * multiplier))
+            for session_type, multiplier in PlanGeneratorService.PACE_ZONES.items()
+        )
+        return distance, paces
     
-    def _format_pace(self, seconds_per_km: Optional[int]) -> str:
+    @staticmethod
+    def _format_pace(seconds_per_km: Optional[int]) -> str:
         """Format pace as MM:SS/km."""
         if not seconds_per_km:
             return "N/A"
-        minutes = seconds_per_km // 60
-        seconds = seconds_per_km % 60
-        return f"{minutes}:{seconds:02d}/km"
+        minutes, seconds = divmod(seconds_per_km, 60)
+        return f"{minutes}:{_PAD2[seconds]}/km"
     
     async def generate_plan(
         self, goal: RaceGoal, user: User, chat_context: str = ""
@@ -236,8 +368,11 @@ class PlanGeneratorService:
         # Get user's activity history profile
         activity_profile = await self._get_user_activity_profile(user, days=90)
         
-        # Calculate target paces
-        target_paces = self._calculate_target_paces(goal)
+        # Race distance and target paces
+        race_distance, paces = self._race_targets(
+            goal.race_type, goal.distance_km, goal.target_time_seconds
+        )
+        target_paces = dict(paces)
         
         # Parse available days (1-7, Monday to Sunday)
         # Note: Chat context might override this (handled by LLM)
@@ -253,7 +388,7 @@ class PlanGeneratorService:
             # Race details
             "race_name": goal.name,
             "race_type": goal.race_type,
-            "race_distance_km": self.RACE_DISTANCES.get(goal.race_type, goal.distance_km or 10),
+            "race_distance_km": race_distance,
             "race_date": goal.race_date.isoformat(),
             "weeks_until_race": weeks_until_race,
             "target_time": goal.target_time_formatted,
@@ -267,12 +402,9 @@ class PlanGeneratorService:
             
             # Training constraints
             "available_days": available_days,
-            "available_days_names": [
-                ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"][d-1]
-                for d in available_days
-            ],
+            "available_days_names": [_WEEKDAY_NAMES_FR[d-1] for d in available_days],
             "long_run_day": goal.long_run_day,
-            "long_run_day_name": ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"][goal.long_run_day-1],
+            "long_run_day_name": _WEEKDAY_NAMES_FR[goal.long_run_day-1],
             "max_weekly_hours": goal.max_weekly_hours,
             
             # Target paces
@@ -302,10 +434,26 @@ class PlanGeneratorService:
         
         return sessions, explanation
     
+    @staticmethod
+    def _plan_cache_key(prompt: str) -> str:
+        """
+        Build the LLM plan cache key for a rendered prompt.
+        
+        Keying on the prompt itself means every value shown to the model
+        (fitness metrics, history, records, notes) is part of the key, so a
+        plan and its personalized explanation are only ever reused for the
+        exact same inputs, never handed to another athlete.
+        """
+        return hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+    
     async def _generate_plan_with_explanation(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """Call LLM to generate the training plan with explanation."""
-        try:
-            prompt = self.llm_service.provider.load_prompt("generate_plan")
+        provider = self.llm_service.provider
+        if not provider.has_prompt("generate_plan"):
+            # Use inline prompt if the registry has no plan prompt
+            prompt = self._get_inline_prompt(context)
+        else:
+            prompt = provider.load_prompt("generate_plan")
             
             # Get athlete profile summary
             from app.services.athlete_profile_service import AthleteProfileService
@@ -347,22 +495,29 @@ class PlanGeneratorService:
             # User constraints from notes or thread history
             constraints = context.get("user_notes", "") or "Aucune contrainte spécifique mentionnée."
             prompt = prompt.replace("{constraints}", constraints)
-            
-        except FileNotFoundError:
-            # Use inline prompt if file not found
-            prompt = self._get_inline_prompt(context)
+        
+        cache_key = self._plan_cache_key(prompt)
+        entry = _PLAN_CACHE.get(cache_key)
+        if entry and datetime.now() - entry["timestamp"] < _PLAN_CACHE_TTL:
+            return entry["data"]
         
         try:
-            result = await self.llm_service.provider.complete_json(
+            result = await provider.complete_json(
                 prompt, 
                 model="pro",
                 temperature=0.4,
             )
-            return result
         except Exception as e:
             # Return empty for fallback
             print(f"LLM Error: {e}")
             return {"weeks": [], "explanation": None}
+        
+        if result.get("weeks"):
+            _PLAN_CACHE.pop(cache_key, None)
+            if len(_PLAN_CACHE) >= _PLAN_CACHE_MAX_ENTRIES:
+                del _PLAN_CACHE[next(iter(_PLAN_CACHE))]
+            _PLAN_CACHE[cache_key] = {"timestamp": datetime.now(), "data": result}
+        return result
     
     def _get_inline_prompt(self, context: Dict[str, Any]) -> str:
         """Generate inline prompt for plan generation."""
@@ -370,7 +525,7 @@ class PlanGeneratorService:
 
 ## Contexte de l'athlète
 
-{json.dumps(context, indent=2, default=str, ensure_ascii=False)}
+{json.dumps(context, default=str, ensure_ascii=False, separators=(",", ":"))}
 
 ## Instructions
 
@@ -490,32 +645,18 @@ et augmente progressivement. N'hésitez pas à ajuster si les séances sont trop
         # Base weekly volume on history or conservative default
         base_weekly_km = profile.get("weekly_volume_km", 20) if profile.get("has_history") else 20
         
-        # Determine training phases
-        taper_weeks = min(2, weeks_until_race // 6)
-        peak_weeks = min(2, (weeks_until_race - taper_weeks) // 4)
-        build_weeks = weeks_until_race - taper_weeks - peak_weeks
+        # Paces never change across the plan: format them once
+        formatted_paces = {k: self._format_pace(v) for k, v in target_paces.items()}
         
-        for week_num in range(1, weeks_until_race + 1):
+        schedule = self._get_week_schedule(weeks_until_race)
+        
+        for week_num, (phase, volume_mult) in enumerate(schedule, start=1):
             week_sessions = []
             
-            # Determine phase
-            if week_num > build_weeks + peak_weeks:
-                phase = "taper"
-                volume_mult = 0.5 + (0.2 * (weeks_until_race - week_num))
-            elif week_num > build_weeks:
-                phase = "peak"
-                volume_mult = 1.0
-            else:
-                phase = "build"
-                # Progressive build with recovery weeks every 4th week
-                if week_num % 4 == 0:
-                    volume_mult = 0.7  # Recovery week
-                else:
-                    volume_mult = 0.7 + (0.3 * week_num / build_weeks)
-            
             for day in available_days:
                 session_data = self._create_session_for_day(
-                    day, long_run_day, week_num, phase, volume_mult, target_paces
+                    day, long_run_day, week_num, phase, volume_mult,
+                    target_paces, formatted_paces,
                 )
                 if session_data:
                     week_sessions.append(session_data)
@@ -529,43 +670,70 @@ et augmente progressivement. N'hésitez pas à ajuster si les séances sont trop
         
         return weeks
     
+    @staticmethod
+    def _get_week_schedule(weeks_until_race: int) -> List[Tuple[str, float]]:
+        """
+        Compute the (phase, volume multiplier) for every week of a fallback plan.
+        
+        Index 0 is week 1. Build weeks ramp from 70% to 100% volume with a
+        70% recovery week every 4th week, peak weeks hold 100%, and the taper
+        steps volume back down towards race day.
+        """
+        # Determine training phases
+        taper_weeks = min(2, weeks_until_race // 6)
+        peak_weeks = min(2, (weeks_until_race - taper_weeks) // 4)
+        build_weeks = weeks_until_race - taper_weeks - peak_weeks
+        
+        schedule = []
+        for week_num in range(1, weeks_until_race + 1):
+            if week_num > build_weeks + peak_weeks:
+                schedule.append(("taper", 0.5 + (0.2 * (weeks_until_race - week_num))))
+            elif week_num > build_weeks:
+                schedule.append(("peak", 1.0))
+            elif week_num % 4 == 0:
+                schedule.append(("build", 0.7))  # Recovery week
+            else:
+                schedule.append(("build", 0.7 + (0.3 * week_num / build_weeks)))
+        return schedule
+    
     def _create_session_for_day(
         self, day: int, long_run_day: int, week_num: int, 
-        phase: str, volume_mult: float, target_paces: Dict[str, int]
-    ) -> Dict[str, Any]:
+        phase: str, volume_mult: float, target_paces: Dict[str, int],
+        formatted_paces: Dict[str, str],
+    ) -> SessionSpec:
         """Create a detailed session for a specific day."""
         if day == long_run_day:
             duration = int(90 * volume_mult)
-            return {
-                "day": day,
-                "session_type": "long",
-                "duration_minutes": duration,
-                "intensity": "moderate",
-                "pace_per_km": target_paces.get("long"),
-                "terrain_type": "road",
-                "elevation_gain": 0,
-                "intervals": None,
-                "workout_details": f"Sortie longue de {duration} minutes à allure confortable. "
-                                   f"Objectif: {self._format_pace(target_paces.get('long'))}. "
-                                   f"Prenez de l'eau et éventuellement un gel si > 75min.",
-            }
+            return SessionSpec(
+                day=day,
+                session_type="long",
+                duration_minutes=duration,
+                intensity="moderate",
+                pace_per_km=target_paces.get("long"),
+                terrain_type="road",
+                elevation_gain=0,
+                intervals=None,
+                workout_details=_LONG_RUN_DETAILS.format(
+                    duration=duration, pace=formatted_paces.get("long", "N/A")
+                ),
+            )
         
         # Day before long run = easy/recovery
         if (day == long_run_day - 1) or (day == 7 and long_run_day == 1):
             duration = int(35 * volume_mult)
-            return {
-                "day": day,
-                "session_type": "recovery",
-                "duration_minutes": duration,
-                "intensity": "easy",
-                "pace_per_km": target_paces.get("recovery"),
-                "terrain_type": "road",
-                "elevation_gain": 0,
-                "intervals": None,
-                "workout_details": f"Récupération active de {duration} minutes. "
-                                   f"Allure très facile: {self._format_pace(target_paces.get('recovery'))}. "
-                                   f"Prépare les jambes pour la sortie longue.",
-            }
+            return SessionSpec(
+                day=day,
+                session_type="recovery",
+                duration_minutes=duration,
+                intensity="easy",
+                pace_per_km=target_paces.get("recovery"),
+                terrain_type="road",
+                elevation_gain=0,
+                intervals=None,
+                workout_details=_RECOVERY_DETAILS.format(
+                    duration=duration, pace=formatted_paces.get("recovery", "N/A")
+                ),
+            )
         
         # Tempo or interval based on week and phase
         if phase in ["build", "peak"] and day in [2, 3, 4]:
@@ -573,61 +741,56 @@ et augmente progressivement. N'hésitez pas à ajuster si les séances sont trop
                 # Tempo session
                 tempo_duration = 20 + (5 * min(4, week_num//2))
                 duration = int(50 * volume_mult)
-                return {
-                    "day": day,
-                    "session_type": "tempo",
-                    "duration_minutes": duration,
-                    "intensity": "hard",
-                    "pace_per_km": target_paces.get("tempo"),
-                    "terrain_type": "road",
-                    "elevation_gain": 0,
-                    "intervals": None,
-                    "workout_details": f"Échauffement 10min, puis {tempo_duration}min à allure seuil "
-                                       f"({self._format_pace(target_paces.get('tempo'))}), "
-                                       f"puis 10min de retour calme. Effort soutenu mais contrôlé.",
-                }
+                return SessionSpec(
+                    day=day,
+                    session_type="tempo",
+                    duration_minutes=duration,
+                    intensity="hard",
+                    pace_per_km=target_paces.get("tempo"),
+                    terrain_type="road",
+                    elevation_gain=0,
+                    intervals=None,
+                    workout_details=_TEMPO_DETAILS.format(
+                        tempo_duration=tempo_duration, pace=formatted_paces.get("tempo", "N/A")
+                    ),
+                )
             else:
                 # Interval session
                 duration = int(50 * volume_mult)
                 interval_pace = target_paces.get("interval", 300)
-                return {
-                    "day": day,
-                    "session_type": "interval",
-                    "duration_minutes": duration,
-                    "intensity": "hard",
-                    "pace_per_km": None,  # Variable for intervals
-                    "terrain_type": "track",
-                    "elevation_gain": 0,
-                    "intervals": [
+                return SessionSpec(
+                    day=day,
+                    session_type="interval",
+                    duration_minutes=duration,
+                    intensity="hard",
+                    pace_per_km=None,  # Variable for intervals
+                    terrain_type="track",
+                    elevation_gain=0,
+                    intervals=[
                         {"reps": 6 + (week_num//2), "distance_m": 400, "pace_per_km": interval_pace, "recovery_seconds": 60}
                     ],
-                    "workout_details": f"Séance VMA: {6 + (week_num//2)}x400m à allure rapide. Récup 1min.",
-                }
+                    workout_details=f"Séance VMA: {6 + (week_num//2)}x400m à allure rapide. Récup 1min.",
+                )
         
         # Default: Easy Run for any other available day
         duration = int(45 * volume_mult)
-        return {
-            "day": day,
-            "session_type": "easy",
-            "duration_minutes": duration,
-            "intensity": "easy",
-            "pace_per_km": target_paces.get("easy"),
-            "terrain_type": "road",
-            "elevation_gain": 0,
-            "intervals": None,
-            "workout_details": f"Footing tranquille de {duration} minutes à "
-                               f"{self._format_pace(target_paces.get('easy'))}. "
-                               f"Respiration facile, capable de tenir une conversation.",
-        }
+        return SessionSpec(
+            day=day,
+            session_type="easy",
+            duration_minutes=duration,
+            intensity="easy",
+            pace_per_km=target_paces.get("easy"),
+            terrain_type="road",
+            elevation_gain=0,
+            intervals=None,
+            workout_details=_EASY_DETAILS.format(
+                duration=duration, pace=formatted_paces.get("easy", "N/A")
+            ),
+        )
     
     def _get_phase_focus(self, phase: str) -> str:
         """Get focus description for a training phase."""
-        focuses = {
-            "build": "Construction de l'endurance aérobie",
-            "peak": "Travail spécifique et intensité maximale",
-            "taper": "Récupération et fraîcheur pour le jour J",
-        }
-        return focuses.get(phase, "Entraînement général")
+        return _PHASE_FOCUSES.get(phase, "Entraînement général")
     
     def _create_sessions(
         self, 
@@ -637,7 +800,7 @@ et augmente progressivement. N'hésitez pas à ajuster si les séances sont trop
         target_paces: Dict[str, int]
     ) -> List[PlannedSession]:
         """Create PlannedSession objects from the plan structure."""
-        sessions = []
+        rows = []
         today = date.today()
         
         # Calculate the Monday of the current week as plan start
@@ -647,10 +810,14 @@ et augmente progressivement. N'hésitez pas à ajuster si les séances sont trop
         for week_data in plan_structure:
             week_num = week_data.get("week_number", 1)
             phase = week_data.get("phase", "build")
+            week_start = plan_start + timedelta(weeks=week_num-1)
             
             for session_data in week_data.get("sessions", []):
-                day = session_data.get("day", 1)
-                session_date = plan_start + timedelta(weeks=week_num-1, days=day-1)
+                # LLM plans come back as plain dicts, the fallback plan as specs
+                if isinstance(session_data, dict):
+                    session_data = SessionSpec.from_dict(session_data)
+                
+                session_date = week_start + timedelta(days=session_data.day-1)
                 
                 # Skip past dates
                 if session_date < today:
@@ -660,43 +827,40 @@ et augmente progressivement. N'hésitez pas à ajuster si les séances sont trop
                 if session_date > goal.race_date:
                     continue
                 
-                session_type = session_data.get("session_type", "easy")
-                duration = session_data.get("duration_minutes", 45)
-                intensity = session_data.get("intensity", "easy")
-                
-                # Get detailed fields
-                pace = session_data.get("pace_per_km") or target_paces.get(session_type)
-                terrain = session_data.get("terrain_type", "road")
-                elevation = session_data.get("elevation_gain", 0)
-                intervals = session_data.get("intervals")
-                workout_details = session_data.get("workout_details", "")
+                session_type = session_data.session_type
+                duration = session_data.duration_minutes
+                pace = session_data.pace_per_km or target_paces.get(session_type)
                 
                 # Generate title and description
                 title = self._get_session_title(session_type, week_num, phase)
-                description = session_data.get("description") or self._get_session_description(
+                description = session_data.description or self._get_session_description(
                     session_type, duration, pace
                 )
                 
-                session = PlannedSession(
-                    user_id=user.id,
-                    race_goal_id=goal.id,
-                    scheduled_date=session_date,
-                    week_number=week_num,
-                    session_type=session_type,
-                    title=title,
-                    description=description,
-                    target_duration=duration,
-                    target_intensity=intensity,
-                    target_pace_per_km=pace,
-                    terrain_type=terrain,
-                    elevation_gain=elevation,
-                    intervals=intervals,
-                    workout_details=workout_details,
-                    status="planned",
-                )
-                
-                self.db.add(session)
-                sessions.append(session)
+                rows.append({
+                    "user_id": user.id,
+                    "race_goal_id": goal.id,
+                    "scheduled_date": session_date,
+                    "week_number": week_num,
+                    "session_type": session_type,
+                    "title": title,
+                    "description": description,
+                    "target_duration": duration,
+                    "target_intensity": session_data.intensity,
+                    "target_pace_per_km": pace,
+                    "terrain_type": session_data.terrain_type,
+                    "elevation_gain": session_data.elevation_gain,
+                    "intervals": session_data.intervals,
+                    "workout_details": session_data.workout_details,
+                    "status": "planned",
+                })
+        
+        # Insert all sessions in one batched statement, getting ORM objects back
+        sessions = []
+        if rows:
+            sessions = list(self.db.scalars(
+                insert(PlannedSession).returning(PlannedSession), rows
+            ))
         
         # Add Race Day Session
         race_session = self._create_race_session(goal, user)
@@ -708,33 +872,21 @@ et augmente progressivement. N'hésitez pas à ajuster si les séances sont trop
     
     def _get_session_title(self, session_type: str, week_num: int, phase: str) -> str:
         """Generate a title for the session."""
-        titles = {
-            "easy": f"Footing tranquille - S{week_num}",
-            "long": f"Sortie longue - S{week_num}",
-            "tempo": f"Tempo/Allure seuil - S{week_num}",
-            "interval": f"Fractionné - S{week_num}",
-            "recovery": f"Récupération active - S{week_num}",
-            "rest": f"Repos - S{week_num}",
-            "cross": f"Cross-training - S{week_num}",
-        }
-        return titles.get(session_type, f"{session_type.title()} - S{week_num}")
+        template = _SESSION_TITLES.get(session_type)
+        if template is None:
+            return f"{session_type.title()} - S{week_num}"
+        return template.format(week_num=week_num)
     
     def _get_session_description(
         self, session_type: str, duration: int, pace: Optional[int] = None
     ) -> str:
         """Generate a default description for the session."""
-        pace_str = self._format_pace(pace) if pace else "allure confortable"
+        template = _SESSION_DESCRIPTIONS.get(session_type)
+        if template is None:
+            return f"Entraînement de {duration} minutes."
         
-        descriptions = {
-            "easy": f"Course facile de {duration}min à {pace_str}. Respiration aisée.",
-            "long": f"Sortie longue de {duration}min à {pace_str}. Restez hydraté.",
-            "tempo": f"Échauffement 10min, {duration-20}min à {pace_str}, retour calme 10min.",
-            "interval": f"15min échauffement + séries de fractionné + 10min retour calme.",
-            "recovery": f"Footing très léger de {duration}min pour la récupération.",
-            "rest": "Jour de repos complet. Étirements légers si souhaité.",
-            "cross": f"{duration} minutes de vélo, natation ou autre activité sans impact.",
-        }
-        return descriptions.get(session_type, f"Entraînement de {duration} minutes.")
+        pace_str = self._format_pace(pace) if pace else "allure confortable"
+        return template.format(duration=duration, pace=pace_str, tempo_main=duration-20)
 
     def _create_race_session(self, goal: RaceGoal, user: User) -> PlannedSession:
         """Create the final race session."""
@@ -749,7 +901,7 @@ et augmente progressivement. N'hésitez pas à ajuster si les séances sont trop
              s = goal.target_time_seconds % 60
              target_time = f"{h}h {m:02d}m {s:02d}s"
              
-        distance = self.RACE_DISTANCES.get(goal.race_type, goal.distance_km or 10)
+        distance, _ = self._race_targets(goal.race_type, goal.distance_km, goal.target_time_seconds)
         
         # Determine pace
         pace = None
@@ -1,23 +1,83 @@
 """Strava API integration service."""
 
-import httpx
+import asyncio
+import time
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
+from app.http_clients import STRAVA_API_URL, get_strava_client, read_json
 from app.models import User, Activity
 from app.services.llm_service import LLMService
 from app.services.metrics_service import MetricsService
 
+# Activity column -> (Strava summary field, default) for fields copied as-is
+_FIELD_MAP = {
+    "activity_type": ("type", "Run"),
+    "name": ("name", "Activity"),
+    "description": ("description", None),
+    "timezone": ("timezone", None),
+    "distance": ("distance", 0),
+    "moving_time": ("moving_time", 0),
+    "elapsed_time": ("elapsed_time", 0),
+    "total_elevation_gain": ("total_elevation_gain", 0),
+    "average_heartrate": ("average_heartrate", None),
+    "max_heartrate": ("max_heartrate", None),
+    "has_heartrate": ("has_heartrate", False),
+    "average_speed": ("average_speed", 0),
+    "max_speed": ("max_speed", 0),
+    "average_watts": ("average_watts", None),
+    "weighted_average_watts": ("weighted_average_watts", None),
+    "start_latlng": ("start_latlng", None),
+    "end_latlng": ("end_latlng", None),
+}
+
+
+def _to_row(activity_data: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    """Map a Strava activity summary to Activity column values."""
+    get = activity_data.get
+    row = {column: get(src, default) for column, (src, default) in _FIELD_MAP.items()}
+    row["user_id"] = user_id
+    row["strava_id"] = str(activity_data["id"])
+    # Python 3.11's fromisoformat understands Strava's trailing "Z"
+    row["start_date"] = datetime.fromisoformat(activity_data["start_date"])
+    start_date_local = get("start_date_local")
+    row["start_date_local"] = datetime.fromisoformat(start_date_local) if start_date_local else None
+    return row
+
 
 class StravaService:
     """Service for Strava API integration."""
     
-    BASE_URL = "https://www.strava.com/api/v3"
+    BASE_URL = STRAVA_API_URL
     AUTH_URL = "https://www.strava.com/oauth/authorize"
     TOKEN_URL = "https://www.strava.com/oauth/token"
     
+    # Activities hydrated (detail + streams) concurrently during sync
+    SYNC_CONCURRENCY = 16
+    # Concurrent batched classification requests during sync
+    SYNC_CLASSIFY_WORKERS = 4
+    # Classify a partial batch this long after its first activity arrived
+    SYNC_CLASSIFY_FLUSH_SECONDS = 2.0
+    # Bound on activities waiting in each sync pipeline stage
+    SYNC_QUEUE_SIZE = 64
+    # New activities added per commit during sync
+    SYNC_COMMIT_BATCH = 50
+    # Re-fetch this far before the last clean sync on incremental syncs
+    SYNC_OVERLAP_HOURS = 6
+    
+    # Shared across instances: user_id -> (access_token, expires_at as epoch seconds)
+    _token_cache: Dict[int, Tuple[str, float]] = {}
+    # One refresh in flight per user
+    _refresh_locks: Dict[int, asyncio.Lock] = {}
+    # Cached tokens this close to expiry are re-checked / refreshed
+    TOKEN_EXPIRY_MARGIN_SECONDS = 60
+    # Shared across instances: user_id -> (fetched_at as monotonic seconds, stats)
+    _stats_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+    # Athlete stats only change when activities sync, so serve them from cache this long
+    STATS_CACHE_TTL_SECONDS = 300
+    
     def __init__(self, db: Session):
         self.db = db
         self.settings = get_settings()
@@ -37,29 +97,58 @@ class StravaService:
     
     async def exchange_code(self, code: str) -> Dict[str, Any]:
         """Exchange authorization code for tokens."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                self.TOKEN_URL,
-                data={
-                    "client_id": self.settings.strava_client_id,
-                    "client_secret": self.settings.strava_client_secret,
-                    "code": code,
-                    "grant_type": "authorization_code",
-                },
-            )
-            response.raise_for_status()
-            return response.json()
+        client = get_strava_client()
+        response = await client.post(
+            self.TOKEN_URL,
+            data={
+                "client_id": self.settings.strava_client_id,
+                "client_secret": self.settings.strava_client_secret,
+                "code": code,
+                "grant_type": "authorization_code",
+            },
+        )
+        response.raise_for_status()
+        return read_json(response)
     
     async def refresh_token(self, user: User) -> Optional[str]:
         """Refresh access token if expired."""
         if not user.strava_refresh_token:
             return None
         
-        # Check if token is still valid
-        if user.strava_token_expires_at and user.strava_token_expires_at > datetime.utcnow():
-            return user.strava_access_token
+        # Fast path: recently validated token, still the one stored on the user
+        cached = self._token_cache.get(user.id)
+        if (
+            cached
+            and cached[0] == user.strava_access_token
+            and cached[1] - time.time() > self.TOKEN_EXPIRY_MARGIN_SECONDS
+        ):
+            return cached[0]
         
-        async with httpx.AsyncClient() as client:
+        # Only one coroutine refreshes a given user's token at a time
+        lock = self._refresh_locks.setdefault(user.id, asyncio.Lock())
+        async with lock:
+            # Another coroutine may have refreshed while we waited, possibly
+            # through a different (now stale) User instance
+            cached = self._token_cache.get(user.id)
+            user_expires_at = (
+                user.strava_token_expires_at.timestamp() if user.strava_token_expires_at else 0.0
+            )
+            if (
+                cached
+                and cached[1] >= user_expires_at
+                and cached[1] - time.time() > self.TOKEN_EXPIRY_MARGIN_SECONDS
+            ):
+                return cached[0]
+            
+            # Check if token is still valid
+            if user.strava_token_expires_at and user.strava_token_expires_at > datetime.utcnow():
+                self._token_cache[user.id] = (
+                    user.strava_access_token,
+                    user.strava_token_expires_at.timestamp(),
+                )
+                return user.strava_access_token
+            
+            client = get_strava_client()
             response = await client.post(
                 self.TOKEN_URL,
                 data={
@@ -73,7 +162,7 @@ class StravaService:
             if response.status_code != 200:
                 return None
             
-            data = response.json()
+            data = read_json(response)
             
             # Update user tokens
             user.strava_access_token = data["access_token"]
@@ -81,117 +170,187 @@ class StravaService:
             user.strava_token_expires_at = datetime.fromtimestamp(data["expires_at"])
             self.db.commit()
             
+            self._token_cache[user.id] = (user.strava_access_token, float(data["expires_at"]))
             return user.strava_access_token
     
-    async def get_activities(
+    async def _fetch_activities_page(
+        self, access_token: str, params: Dict[str, Any], page: int
+    ) -> List[Dict[str, Any]]:
+        """Fetch one page of the athlete's activity list."""
+        client = get_strava_client()
+        response = await client.get(
+            "/athlete/activities",
+            headers={"Authorization": f"Bearer {access_token}"},
+            params={**params, "page": page},
+        )
+        response.raise_for_status()
+        return read_json(response)
+    
+    async def iter_activity_pages(
         self,
         user: User,
         after: Optional[datetime] = None,
         before: Optional[datetime] = None,
         per_page: int = 200,
-    ) -> List[Dict[str, Any]]:
-        """Fetch all activities from Strava within the timeframe (paginated)."""
-        access_token = await self.refresh_token(user)
+        access_token: Optional[str] = None,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield pages of activities from Strava within the timeframe.
+        
+        The next page is requested before the current one is yielded, so it
+        downloads while the caller processes the current page.
+        """
+        access_token = access_token or await self.refresh_token(user)
         if not access_token:
             raise ValueError("Strava non connecté. Veuillez d'abord connecter votre compte Strava.")
         
-        all_activities = []
-        page = 1
+        params = {"per_page": per_page}
+        if after:
+            params["after"] = int(after.timestamp())
+        if before:
+            params["before"] = int(before.timestamp())
         
-        async with httpx.AsyncClient() as client:
-            while True:
-                params = {"per_page": per_page, "page": page}
-                if after:
-                    params["after"] = int(after.timestamp())
-                if before:
-                    params["before"] = int(before.timestamp())
-                
-                response = await client.get(
-                    f"{self.BASE_URL}/athlete/activities",
-                    headers={"Authorization": f"Bearer {access_token}"},
-                    params=params,
-                )
-                response.raise_for_status()
-                page_data = response.json()
+        page = 1
+        next_page_task = asyncio.create_task(
+            self._fetch_activities_page(access_token, params, page)
+        )
+        try:
+            while next_page_task is not None:
+                page_data = await next_page_task
+                next_page_task = None
                 
                 if not page_data:
                     break
                 
-                all_activities.extend(page_data)
-                
-                if len(page_data) < per_page:
-                    break
-                
-                page += 1
+                if len(page_data) == per_page:
+                    page += 1
+                    next_page_task = asyncio.create_task(
+                        self._fetch_activities_page(access_token, params, page)
+                    )
                 
-        return all_activities
+                yield page_data
+        finally:
+            if next_page_task is not None:
+                next_page_task.cancel()
     
     async def get_activity_streams(
         self,
         user: User,
         activity_id: str,
         stream_types: List[str] = None,
+        access_token: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Fetch activity streams (time series data)."""
-        access_token = await self.refresh_token(user)
+        access_token = access_token or await self.refresh_token(user)
         if not access_token:
             return {}
         
         stream_types = stream_types or ["heartrate", "velocity_smooth", "altitude", "cadence"]
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.BASE_URL}/activities/{activity_id}/streams",
-                headers={"Authorization": f"Bearer {access_token}"},
-                params={
-                    "keys": ",".join(stream_types),
-                    "key_by_type": True,
-                },
-            )
-            
-            if response.status_code == 404:
-                return {}
-            
-            response.raise_for_status()
-            return response.json()
+        client = get_strava_client()
+        response = await client.get(
+            f"/activities/{activity_id}/streams",
+            headers={"Authorization": f"Bearer {access_token}"},
+            params={
+                "keys": ",".join(stream_types),
+                "key_by_type": True,
+            },
+        )
+        
+        if response.status_code == 404:
+            return {}
+        
+        response.raise_for_status()
+        return read_json(response)
 
     async def get_athlete_stats(self, user: User) -> Dict[str, Any]:
         """Fetch athlete statistics (totals, records) from Strava."""
         if not user.strava_athlete_id:
             return {}
 
+        now = time.monotonic()
+        cached = self._stats_cache.get(user.id)
+        if cached and now - cached[0] < self.STATS_CACHE_TTL_SECONDS:
+            return cached[1]
+
         access_token = await self.refresh_token(user)
         if not access_token:
             return {}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.BASE_URL}/athletes/{user.strava_athlete_id}/stats",
-                headers={"Authorization": f"Bearer {access_token}"},
-            )
-            
-            if response.status_code != 200:
-                print(f"Error fetching stats for user {user.id}: {response.text}")
-                return {}
+        client = get_strava_client()
+        response = await client.get(
+            f"/athletes/{user.strava_athlete_id}/stats",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        
+        if response.status_code != 200:
+            print(f"Error fetching stats for user {user.id}: {response.text}")
+            return {}
 
-            return response.json()
+        stats = read_json(response)
+        self._stats_cache[user.id] = (now, stats)
+        return stats
 
-    async def get_activity_detail(self, user: User, activity_id: str) -> Dict[str, Any]:
+    async def get_activity_detail(
+        self, user: User, activity_id: str, access_token: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Fetch detailed activity data including best_efforts."""
-        access_token = await self.refresh_token(user)
+        access_token = access_token or await self.refresh_token(user)
         if not access_token:
             return {}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.BASE_URL}/activities/{activity_id}",
-                headers={"Authorization": f"Bearer {access_token}"},
-            )
-            
-            if response.status_code != 200:
-                return {}
+        client = get_strava_client()
+        response = await client.get(
+            f"/activities/{activity_id}",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        
+        if response.status_code != 200:
+            return {}
 
-            return response.json()
+        return read_json(response)
+    
+    async def _hydrate_activity(
+        self, user: User, activity_data: Dict[str, Any], access_token: str
+    ) -> Dict[str, Any]:
+        """
+        Build an Activity row (column -> value) from Strava summary data, with
+        best efforts, gear and streams filled in from the detail endpoints.
+        """
+        row = _to_row(activity_data, user.id)
+        strava_id = row["strava_id"]
+        
+        # Fetch detailed activity (best_efforts, gear_id) and streams in parallel
+        detail, streams = await asyncio.gather(
+            self.get_activity_detail(user, strava_id, access_token=access_token),
+            self.get_activity_streams(user, strava_id, access_token=access_token),
+            return_exceptions=True,
+        )
+        
+        if detail and not isinstance(detail, Exception):
+            row["best_efforts"] = detail.get("best_efforts")
+            row["gear_id"] = detail.get("gear_id")
+        
+        if streams and not isinstance(streams, Exception):
+            row["telemetry"] = streams
+        
+        return row
+    
+    @staticmethod
+    def _classification_input(row: Dict[str, Any]) -> Dict[str, Any]:
+        """Activity fields sent to the LLM for classification."""
+        return {
+            "name": row["name"],
+            "type": row["activity_type"],
+            "start_time": row["start_date_local"].isoformat() if row["start_date_local"] else None,
+            "distance_km": round(row["distance"] / 1000, 2),
+            "duration_min": round(row["moving_time"] / 60, 1),
+            "average_heartrate": row["average_heartrate"],
+            "max_heartrate": row["max_heartrate"],
+            "average_speed_kmh": round(row["average_speed"] * 3.6, 1),
+            "start_location": row["start_latlng"],
+            "end_location": row["end_latlng"],
+        }
     
     async def sync_activities(
         self,
@@ -203,111 +362,162 @@ class StravaService:
         
         Returns summary of synced activities.
         """
-        after = datetime.utcnow() - timedelta(days=days)
-        activities_data = await self.get_activities(user, after=after)
+        # Refresh once up front; every request of this sync reuses the token
+        access_token = await self.refresh_token(user)
+        if not access_token:
+            raise ValueError("Strava non connecté. Veuillez d'abord connecter votre compte Strava.")
+        
+        # Only ask Strava for what may be missing. The stored window advances
+        # only after a clean sync, so a failed or interrupted one (which may have
+        # committed newer rows but not older ones) is redone next time; a `days`
+        # reaching past the window refetches all of it (stored ids are skipped).
+        sync_started = datetime.utcnow()
+        requested_since = sync_started - timedelta(days=days)
+        window_covered = (
+            user.strava_synced_since is not None
+            and user.strava_synced_until is not None
+            and user.strava_synced_since <= requested_since
+        )
+        if window_covered:
+            after = user.strava_synced_until - timedelta(hours=self.SYNC_OVERLAP_HOURS)
+        else:
+            after = requested_since
         
         synced = 0
         skipped = 0
         classified = 0
+        total_fetched = 0
+        seen_ids = set()
         
-        for activity_data in activities_data:
-            strava_id = str(activity_data["id"])
-            
-            # Check if already exists
-            existing = (
-                self.db.query(Activity)
-                .filter(Activity.strava_id == strava_id)
-                .first()
-            )
-            
-            if existing:
-                skipped += 1
-                continue
-            
-            # Create activity
-            activity = Activity(
-                user_id=user.id,
-                strava_id=strava_id,
-                activity_type=activity_data.get("type", "Run"),
-                name=activity_data.get("name", "Activity"),
-                description=activity_data.get("description"),
-                start_date=datetime.fromisoformat(
-                    activity_data["start_date"].replace("Z", "+00:00")
-                ),
-                start_date_local=datetime.fromisoformat(
-                    activity_data["start_date_local"].replace("Z", "+00:00")
-                ) if activity_data.get("start_date_local") else None,
-                timezone=activity_data.get("timezone"),
-                distance=activity_data.get("distance", 0),
-                moving_time=activity_data.get("moving_time", 0),
-                elapsed_time=activity_data.get("elapsed_time", 0),
-                total_elevation_gain=activity_data.get("total_elevation_gain", 0),
-                average_heartrate=activity_data.get("average_heartrate"),
-                max_heartrate=activity_data.get("max_heartrate"),
-                has_heartrate=activity_data.get("has_heartrate", False),
-                average_speed=activity_data.get("average_speed", 0),
-                max_speed=activity_data.get("max_speed", 0),
-                average_watts=activity_data.get("average_watts"),
-                weighted_average_watts=activity_data.get("weighted_average_watts"),
-                start_latlng=activity_data.get("start_latlng"),
-                end_latlng=activity_data.get("end_latlng"),
-            )
-            
-            # Fetch detailed activity to get best_efforts and gear_id
-            try:
-                detail = await self.get_activity_detail(user, strava_id)
-                if detail:
-                    activity.best_efforts = detail.get("best_efforts")
-                    activity.gear_id = detail.get("gear_id")
-            except Exception:
-                pass
-            
-            # Try to fetch streams for more detailed data
-            try:
-                streams = await self.get_activity_streams(user, strava_id)
-                if streams:
-                    activity.telemetry = streams
-            except Exception:
-                pass
-            
-            # Classify activity using LLM
-            try:
-                classification = await self.llm_service.classify_activity({
-                    "name": activity.name,
-                    "type": activity.activity_type,
-                    "start_time": activity.start_date_local.isoformat() if activity.start_date_local else None,
-                    "distance_km": round(activity.distance / 1000, 2),
-                    "duration_min": round(activity.moving_time / 60, 1),
-                    "average_heartrate": activity.average_heartrate,
-                    "max_heartrate": activity.max_heartrate,
-                    "average_speed_kmh": round(activity.average_speed * 3.6, 1),
-                    "start_location": activity.start_latlng,
-                    "end_location": activity.end_latlng,
-                })
+        # Pipeline: pages -> fetch_q -> fetch workers (detail + streams)
+        # -> classify_q -> classify workers (batched LLM) -> session.
+        # Strava and LLM requests overlap; the bounded queues cap memory.
+        fetch_q: asyncio.Queue = asyncio.Queue(maxsize=self.SYNC_QUEUE_SIZE)
+        classify_q: asyncio.Queue = asyncio.Queue(maxsize=self.SYNC_QUEUE_SIZE)
+        batch_size = self.llm_service.CLASSIFY_BATCH_SIZE
+        
+        # Hydrated activities waiting to be inserted
+        rows: List[Dict[str, Any]] = []
+        
+        def flush_rows():
+            nonlocal synced
+            if rows:
+                self.db.bulk_insert_mappings(Activity, rows)
+                self.db.commit()
+                synced += len(rows)
+                rows.clear()
+        
+        async def fetch_worker():
+            while (activity_data := await fetch_q.get()) is not None:
+                await classify_q.put(await self._hydrate_activity(user, activity_data, access_token))
+        
+        async def classify_worker():
+            nonlocal classified
+            done = False
+            while not done:
+                row = await classify_q.get()
+                if row is None:
+                    break
                 
-                activity.classification = classification.get("classification", "workout")
-                activity.classification_confidence = classification.get("confidence", 0.5)
-                activity.classification_reasoning = classification.get("reasoning", "")
-                activity.include_in_training_load = classification.get("include_in_training_load", True)
-                classified += 1
-            except Exception as e:
-                # Default to workout if classification fails
-                activity.classification = "workout"
-                activity.classification_confidence = 0.5
-                activity.include_in_training_load = True
+                # Fill a batch, flushing it early if activities arrive slowly.
+                # asyncio.timeout (unlike wait_for on 3.11) never swallows the
+                # TaskGroup's cancellation, and a get() it interrupts leaves
+                # the item in the queue.
+                batch = [row]
+                try:
+                    async with asyncio.timeout(self.SYNC_CLASSIFY_FLUSH_SECONDS):
+                        while len(batch) < batch_size:
+                            row = await classify_q.get()
+                            if row is None:
+                                done = True
+                                break
+                            batch.append(row)
+                except TimeoutError:
+                    pass
+                
+                classifications = await self.llm_service.classify_activities_batch(
+                    [self._classification_input(r) for r in batch]
+                )
+                
+                for row, classification in zip(batch, classifications):
+                    if classification:
+                        row["classification"] = classification.get("classification", "workout")
+                        row["classification_confidence"] = classification.get("confidence", 0.5)
+                        row["classification_reasoning"] = classification.get("reasoning", "")
+                        row["include_in_training_load"] = classification.get("include_in_training_load", True)
+                        classified += 1
+                    else:
+                        # Default to workout if classification fails
+                        row["classification"] = "workout"
+                        row["classification_confidence"] = 0.5
+                        row["include_in_training_load"] = True
+                
+                # Calculate TRIMP for the batch straight from the row dicts
+                included = [r for r in batch if r["include_in_training_load"]]
+                trimps = self.metrics_service.calculate_trimp_batch(included, user)
+                for row, trimp in zip(included, trimps):
+                    row["trimp_score"] = trimp
+                
+                rows.extend(batch)
+                
+                # Session work is synchronous, so workers never interleave inside it
+                if len(rows) >= self.SYNC_COMMIT_BATCH:
+                    flush_rows()
+        
+        try:
+            async with asyncio.TaskGroup() as tg:
+                fetch_workers = [tg.create_task(fetch_worker()) for _ in range(self.SYNC_CONCURRENCY)]
+                classify_workers = [
+                    tg.create_task(classify_worker()) for _ in range(self.SYNC_CLASSIFY_WORKERS)
+                ]
             
-            # Calculate TRIMP
-            if activity.include_in_training_load:
-                activity.trimp_score = self.metrics_service.calculate_trimp(activity, user)
+                # The next page downloads while this one is being queued
+                async for activities_data in self.iter_activity_pages(
+                    user, after=after, access_token=access_token
+                ):
+                    total_fetched += len(activities_data)
+                
+                    # Look up already-synced activities in one query
+                    incoming_ids = [str(a["id"]) for a in activities_data]
+                    existing_ids = {
+                        strava_id for (strava_id,) in
+                        self.db.query(Activity.strava_id)
+                        .filter(Activity.strava_id.in_(incoming_ids))
+                        .all()
+                    }
+                
+                    for strava_id, activity_data in zip(incoming_ids, activities_data):
+                        if strava_id in existing_ids or strava_id in seen_ids:
+                            skipped += 1
+                            continue
+                    
+                        seen_ids.add(strava_id)
+                        await fetch_q.put(activity_data)
             
-            self.db.add(activity)
-            synced += 1
+                # Drain the pipeline: one sentinel per worker, stage by stage
+                for _ in fetch_workers:
+                    await fetch_q.put(None)
+                await asyncio.gather(*fetch_workers)
+                for _ in classify_workers:
+                    await classify_q.put(None)
+        except ExceptionGroup as eg:
+            # Surface the first failure (e.g. Strava not connected) as-is
+            raise eg.exceptions[0] from eg
         
+        flush_rows()
+        
+        # Everything from the window start up to sync_started is stored now
+        if not window_covered:
+            user.strava_synced_since = requested_since
+        user.strava_synced_until = sync_started
         self.db.commit()
         
+        # Totals just changed: next stats request goes to Strava
+        self._stats_cache.pop(user.id, None)
+        
         return {
             "synced": synced,
             "skipped": skipped,
             "classified": classified,
-            "total_fetched": len(activities_data),
+            "total_fetched": total_fetched,
         }
@@ -1,17 +1,57 @@
 """Backfill best_efforts for existing activities."""
 import asyncio
+import os
 import sys
+import time
+from collections import deque
 sys.path.insert(0, "/app")
 
 from sqlalchemy.orm import Session
 from app.database import SessionLocal, engine
+from app.http_clients import close_http_clients
 from app.models import User, Activity
 from app.services.strava_service import StravaService
 
+# Detail requests in flight at once
+CONCURRENCY = 10
+# Strava allows 600 requests / 15 min: stay under it with some headroom
+RATE_LIMIT_CALLS = 500
+RATE_LIMIT_PERIOD = 15 * 60
+# Commit pending updates at most this often (seconds)
+COMMIT_INTERVAL = 5.0
+# Progress summary every N activities
+PROGRESS_EVERY = 100
+# Per-activity output only when VERBOSE is set
+VERBOSE = bool(os.environ.get("VERBOSE"))
+# Activities loaded from the database at a time
+BATCH_SIZE = 500
+
+
+class RateLimiter:
+    """Allow at most `max_calls` acquisitions per sliding `period` (seconds)."""
+
+    def __init__(self, max_calls: int, period: float):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and self._calls[0] <= now - self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    break
+                await asyncio.sleep(self._calls[0] + self.period - now)
+            self._calls.append(time.monotonic())
+
 
 async def backfill_best_efforts():
     """Fetch and store best_efforts for all existing activities."""
     db = SessionLocal()
+    limiter = RateLimiter(RATE_LIMIT_CALLS, RATE_LIMIT_PERIOD)
     try:
         users = db.query(User).filter(User.strava_access_token.isnot(None)).all()
         
@@ -19,35 +59,86 @@ async def backfill_best_efforts():
             print(f"Processing user {user.id}: {user.email}")
             strava_service = StravaService(db)
             
-            # Get activities without best_efforts
-            activities = db.query(Activity).filter(
+            # Activities without best_efforts
+            pending = db.query(Activity).filter(
                 Activity.user_id == user.id,
                 Activity.best_efforts.is_(None),
                 Activity.strava_id.isnot(None)
-            ).all()
+            )
             
-            print(f"  Found {len(activities)} activities to backfill")
+            total = pending.count()
+            print(f"  Found {total} activities to backfill")
+            if not total:
+                continue
             
-            for i, activity in enumerate(activities):
-                try:
-                    detail = await strava_service.get_activity_detail(user, activity.strava_id)
-                    if detail:
-                        activity.best_efforts = detail.get("best_efforts")
+            if not await strava_service.refresh_token(user):
+                print(f"  Skipping user {user.id}: Strava token could not be refreshed")
+                continue
+            
+            sem = asyncio.Semaphore(CONCURRENCY)
+            completed = 0
+            errors = 0
+            efforts_total = 0
+            last_commit = time.monotonic()
+            
+            async def _one(activity: Activity):
+                nonlocal completed, errors, efforts_total, last_commit
+                async with sem:
+                    await limiter.acquire()
+                    try:
+                        # A throttled backfill can outlast the token: re-check it per
+                        # request (a cache lookup until it is about to expire)
+                        access_token = await strava_service.refresh_token(user)
+                        if not access_token:
+                            raise RuntimeError("Strava token could not be refreshed")
+                        detail = await strava_service.get_activity_detail(
+                            user, activity.strava_id, access_token=access_token
+                        )
+                        # Non-200 responses (e.g. 401) come back empty
+                        if not detail:
+                            raise RuntimeError("no activity detail returned by Strava")
+                        best_efforts = detail.get("best_efforts")
+                        activity.best_efforts = best_efforts
                         activity.gear_id = detail.get("gear_id")
-                        print(f"  [{i+1}/{len(activities)}] {activity.name}: {len(activity.best_efforts or [])} efforts")
-                except Exception as e:
-                    print(f"  [{i+1}/{len(activities)}] Error for {activity.name}: {e}")
+                        efforts_total += len(best_efforts or ())
+                        if VERBOSE:
+                            print(f"  [{completed + 1}/{total}] {activity.name}: {len(best_efforts or ())} efforts")
+                    except Exception as e:
+                        errors += 1
+                        if VERBOSE:
+                            print(f"  [{completed + 1}/{total}] Error for {activity.name}: {e}")
                 
-                # Commit every 10 activities
-                if (i + 1) % 10 == 0:
+                # Commit is synchronous, so completions never interleave inside it
+                completed += 1
+                if time.monotonic() - last_commit > COMMIT_INTERVAL:
                     db.commit()
+                    last_commit = time.monotonic()
+                if completed % PROGRESS_EVERY == 0:
+                    print(f"  [{completed}/{total}] errors: {errors}, avg efforts: {efforts_total / completed:.1f}")
+            
+            # Load and process BATCH_SIZE activities at a time (keyset on id), so
+            # memory stays flat however large the backlog is
+            last_id = 0
+            while True:
+                activities = (
+                    pending.filter(Activity.id > last_id)
+                    .order_by(Activity.id)
+                    .limit(BATCH_SIZE)
+                    .all()
+                )
+                if not activities:
+                    break
+                last_id = activities[-1].id
+                
+                await asyncio.gather(*[_one(a) for a in activities])
+                db.commit()
             
-            db.commit()
-            print(f"  Completed user {user.id}")
+            print(f"  Completed user {user.id}: {completed} activities, {errors} errors")
         
         print("Backfill complete!")
     finally:
         db.close()
+        await close_http_clients()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+"""
+Backfill trimp_score for activities stored without one.
+Run this inside Docker: docker exec -it run-sync-backend python scripts/backfill_trimp.py
+
+Mirrors the TRIMP formula in app.services.metrics_service (HR-based Banister
+TRIMP with the activity-type estimate when no HR is available) as a single
+set-based UPDATE, so metrics reads can rely on the stored score. Coefficients,
+multipliers and HR defaults are taken from that module, so only the shape of
+the formula is repeated here.
+"""
+
+import sys
+sys.path.insert(0, "/app")
+
+from app.database import engine
+from app.services.metrics_service import (
+    _DEFAULT_HR_RANGE,
+    _DEFAULT_MAX_HR,
+    _DEFAULT_RESTING_HR,
+    _K_MALE,
+    _TRIMP_NO_HR_DEFAULT,
+    _TRIMP_NO_HR_MULTIPLIERS,
+    _YI_MALE,
+)
+from sqlalchemy import text
+
+_NO_HR_MULTIPLIER_CASES = "\n".join(
+    f"                WHEN '{activity_type}' THEN {multiplier}"
+    for activity_type, multiplier in _TRIMP_NO_HR_MULTIPLIERS.items()
+)
+
+BACKFILL_SQL = f"""
+UPDATE activities AS a
+SET trimp_score = ROUND(CAST(
+    CASE
+        WHEN COALESCE(a.average_heartrate, 0) > 0 THEN
+            (COALESCE(a.moving_time, 0) / 60.0) * s.hr_ratio * {_YI_MALE} * EXP({_K_MALE} * s.hr_ratio)
+        ELSE
+            (COALESCE(a.moving_time, 0) / 60.0) * CASE a.activity_type
+{_NO_HR_MULTIPLIER_CASES}
+                ELSE {_TRIMP_NO_HR_DEFAULT}
+            END
+    END AS NUMERIC), 1)
+FROM (
+    SELECT
+        act.id,
+        GREATEST(0, LEAST(1,
+            (COALESCE(act.average_heartrate, 0) - COALESCE(u.resting_heart_rate, {_DEFAULT_RESTING_HR}))
+            / CASE
+                WHEN COALESCE(u.max_heart_rate, {_DEFAULT_MAX_HR}) - COALESCE(u.resting_heart_rate, {_DEFAULT_RESTING_HR}) <= 0
+                    THEN {_DEFAULT_HR_RANGE}
+                ELSE COALESCE(u.max_heart_rate, {_DEFAULT_MAX_HR}) - COALESCE(u.resting_heart_rate, {_DEFAULT_RESTING_HR})
+              END
+        )) AS hr_ratio
+    FROM activities act
+    JOIN users u ON u.id = act.user_id
+    WHERE act.trimp_score IS NULL
+      AND act.include_in_training_load
+) AS s
+WHERE a.id = s.id
+"""
+
+
+def run_backfill():
+    """Compute and store trimp_score for included activities missing one."""
+    with engine.begin() as conn:
+        result = conn.execute(text(BACKFILL_SQL))
+        print(f"✓ Backfilled trimp_score for {result.rowcount} activities")
+
+
+if __name__ == "__main__":
+    run_backfill()
@@ -13,6 +13,16 @@ import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://runsync:runsync@db:5432/runsync")
 
+# Indexes as (name, "table(columns)")
+INDEXES = [
+    ("ix_coaching_threads_race_goal_id", "coaching_threads(race_goal_id)"),
+    ("ix_coaching_threads_is_archived", "coaching_threads(is_archived)"),
+    ("ix_coaching_messages_thread_id", "coaching_messages(thread_id)"),
+    ("ix_coaching_messages_created_at", "coaching_messages(created_at)"),
+    ("ix_race_goals_is_archived", "race_goals(is_archived)"),
+    ("ix_planned_sessions_is_archived", "planned_sessions(is_archived)"),
+]
+
 def run_migration():
     engine = create_engine(DATABASE_URL)
     
@@ -31,18 +41,6 @@ def run_migration():
             )
         """))
         
-        # Create index on race_goal_id
-        conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS ix_coaching_threads_race_goal_id 
-            ON coaching_threads(race_goal_id)
-        """))
-        
-        # Create index on is_archived
-        conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS ix_coaching_threads_is_archived 
-            ON coaching_threads(is_archived)
-        """))
-        
         # Create coaching_messages table
         print("Creating coaching_messages table...")
         conn.execute(text("""
@@ -59,18 +57,6 @@ def run_migration():
             )
         """))
         
-        # Create index on thread_id
-        conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS ix_coaching_messages_thread_id 
-            ON coaching_messages(thread_id)
-        """))
-        
-        # Create index on created_at
-        conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS ix_coaching_messages_created_at 
-            ON coaching_messages(created_at)
-        """))
-        
         # Add is_archived to race_goals if not exists
         print("Adding is_archived to race_goals...")
         conn.execute(text("""
@@ -81,7 +67,6 @@ def run_migration():
                     WHERE table_name='race_goals' AND column_name='is_archived'
                 ) THEN
                     ALTER TABLE race_goals ADD COLUMN is_archived BOOLEAN DEFAULT FALSE;
-                    CREATE INDEX ix_race_goals_is_archived ON race_goals(is_archived);
                 END IF;
             END $$
         """))
@@ -96,7 +81,6 @@ def run_migration():
                     WHERE table_name='planned_sessions' AND column_name='is_archived'
                 ) THEN
                     ALTER TABLE planned_sessions ADD COLUMN is_archived BOOLEAN DEFAULT FALSE;
-                    CREATE INDEX ix_planned_sessions_is_archived ON planned_sessions(is_archived);
                 END IF;
             END $$
         """))
@@ -118,40 +102,36 @@ def run_migration():
         
         # Migrate existing plan_explanation to coaching thread/message
         print("Migrating existing plan explanations to threads...")
-        conn.execute(text("""
-            DO $$
-            DECLARE
-                goal_rec RECORD;
-                new_thread_id INTEGER;
-                new_message_id INTEGER;
-            BEGIN
-                -- For each goal with a plan_explanation
-                FOR goal_rec IN 
-                    SELECT id, plan_explanation, name 
-                    FROM race_goals 
-                    WHERE plan_explanation IS NOT NULL 
-                    AND plan_explanation != ''
-                    AND NOT EXISTS (
-                        SELECT 1 FROM coaching_threads WHERE race_goal_id = race_goals.id
-                    )
-                LOOP
-                    -- Create a thread
-                    INSERT INTO coaching_threads (race_goal_id, title, created_at)
-                    VALUES (goal_rec.id, 'Plan initial - ' || goal_rec.name, NOW())
-                    RETURNING id INTO new_thread_id;
-                    
-                    -- Create a system message with the explanation
-                    INSERT INTO coaching_messages (thread_id, role, content, message_type, created_at)
-                    VALUES (new_thread_id, 'coach', goal_rec.plan_explanation, 'explanation', NOW())
-                    RETURNING id INTO new_message_id;
-                    
-                    RAISE NOTICE 'Migrated goal % to thread %', goal_rec.id, new_thread_id;
-                END LOOP;
-            END $$
+        # One thread + coach message per goal with an explanation and no thread yet
+        result = conn.execute(text("""
+            WITH new_threads AS (
+                INSERT INTO coaching_threads (race_goal_id, title, created_at)
+                SELECT id, 'Plan initial - ' || name, NOW()
+                FROM race_goals
+                WHERE plan_explanation IS NOT NULL
+                AND plan_explanation != ''
+                AND NOT EXISTS (
+                    SELECT 1 FROM coaching_threads WHERE race_goal_id = race_goals.id
+                )
+                RETURNING id AS thread_id, race_goal_id
+            )
+            INSERT INTO coaching_messages (thread_id, role, content, message_type, created_at)
+            SELECT nt.thread_id, 'coach', rg.plan_explanation, 'explanation', NOW()
+            FROM new_threads nt
+            JOIN race_goals rg ON rg.id = nt.race_goal_id
         """))
+        print(f"Migrated {result.rowcount} goals to threads")
         
         conn.commit()
-        print("✅ Migration completed successfully!")
+    
+    # Build indexes without blocking writes. CONCURRENTLY cannot run inside a
+    # transaction block, so these go through an autocommit connection.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, target in INDEXES:
+            print(f"Creating index {name}...")
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}"))
+    
+    print("✅ Migration completed successfully!")
 
 
 if __name__ == "__main__":
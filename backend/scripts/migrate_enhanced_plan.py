@@ -13,20 +13,12 @@ def run_migration():
     """Add new columns for enhanced training plans."""
     
     migrations = [
-        # PlannedSession new columns
-        """ALTER TABLE planned_sessions 
-           ADD COLUMN IF NOT EXISTS target_pace_per_km INTEGER;""",
-        
-        """ALTER TABLE planned_sessions 
-           ADD COLUMN IF NOT EXISTS terrain_type VARCHAR(50) DEFAULT 'road';""",
-        
-        """ALTER TABLE planned_sessions 
-           ADD COLUMN IF NOT EXISTS elevation_gain INTEGER DEFAULT 0;""",
-        
-        """ALTER TABLE planned_sessions 
-           ADD COLUMN IF NOT EXISTS intervals JSON;""",
-        
+        # PlannedSession new columns: one ALTER, so one catalog update and lock
         """ALTER TABLE planned_sessions 
+           ADD COLUMN IF NOT EXISTS target_pace_per_km INTEGER,
+           ADD COLUMN IF NOT EXISTS terrain_type VARCHAR(50) DEFAULT 'road',
+           ADD COLUMN IF NOT EXISTS elevation_gain INTEGER DEFAULT 0,
+           ADD COLUMN IF NOT EXISTS intervals JSON,
            ADD COLUMN IF NOT EXISTS workout_details TEXT;""",
         
         # RaceGoal new columns
@@ -34,18 +26,11 @@ def run_migration():
            ADD COLUMN IF NOT EXISTS plan_explanation TEXT;""",
     ]
     
-    with engine.connect() as conn:
+    # Single transaction: either every column is added or none is
+    with engine.begin() as conn:
         for sql in migrations:
-            try:
-                conn.execute(text(sql))
-                print(f"✓ Executed: {sql[:60]}...")
-            except Exception as e:
-                if "already exists" in str(e).lower() or "duplicate" in str(e).lower():
-                    print(f"⊘ Column already exists, skipping: {sql[:60]}...")
-                else:
-                    print(f"✗ Error: {e}")
-        
-        conn.commit()
+            conn.execute(text(sql))
+            print(f"✓ Executed: {sql[:60]}...")
     
     print("\n✓ Migration completed successfully!")
 
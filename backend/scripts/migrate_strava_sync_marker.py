@@ -0,0 +1,30 @@
+"""
+Database migration script to add the Strava sync window markers.
+Run this inside Docker: docker exec -it run-sync-backend python scripts/migrate_strava_sync_marker.py
+
+Run it before deploying the User model with these columns: every query on
+users selects them and fails until they exist (see README, Deploying).
+"""
+
+import sys
+sys.path.insert(0, "/app")
+
+from app.database import engine
+from sqlalchemy import text
+
+def run_migration():
+    """Add the last-successful-sync window columns to users."""
+    
+    # Left NULL for existing users: their next sync covers the full requested window
+    sql = """ALTER TABLE users 
+           ADD COLUMN IF NOT EXISTS strava_synced_since TIMESTAMP,
+           ADD COLUMN IF NOT EXISTS strava_synced_until TIMESTAMP;"""
+    
+    with engine.begin() as conn:
+        conn.execute(text(sql))
+        print(f"✓ Executed: {sql[:60]}...")
+    
+    print("\n✓ Migration completed successfully!")
+
+if __name__ == "__main__":
+    run_migration()
@@ -101,8 +101,11 @@ async def test_constraint_parsing():
 async def test_plan_generation_count(goal):
     print("\nTesting Plan Generation Session Count...")
     from app.services.plan_generator_service import PlanGeneratorService
+    from app.models import PlannedSession
     
     db = MagicMock()
+    # Sessions are bulk-inserted with RETURNING: hand back transient objects
+    db.scalars.side_effect = lambda stmt, rows: [PlannedSession(**row) for row in rows]
     generator = PlanGeneratorService(db)
     
     # Mock metric service
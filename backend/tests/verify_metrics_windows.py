@@ -0,0 +1,92 @@
+import sys
+import os
+import math
+from datetime import date, datetime, time, timedelta
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import User, Activity
+from app.services.metrics_service import MetricsService
+
+AS_OF = date(2025, 3, 10)
+
+def make_db():
+    """In-memory SQLite session with the users and activities tables."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[User.__table__, Activity.__table__])
+    return sessionmaker(bind=engine)()
+
+def add_activity(db, user, day, trimp, hour=7, included=True):
+    db.add(Activity(
+        user_id=user.id,
+        strava_id=f"{user.id}-{day.isoformat()}-{hour}",
+        name="Run",
+        activity_type="Run",
+        start_date=datetime.combine(day, time(hour)),
+        distance=10000,
+        moving_time=3000,
+        trimp_score=trimp,
+        include_in_training_load=included,
+    ))
+
+def test_acute_load_window():
+    print("Testing acute load window...")
+    db = make_db()
+    user = User(id=1, email="runner@example.com")
+    db.add(user)
+    
+    # Outside: the day before the window and the day after as_of
+    add_activity(db, user, AS_OF - timedelta(days=7), 1000)
+    add_activity(db, user, AS_OF + timedelta(days=1), 1000)
+    # Inside: first day of the window (as_of - 6) and late on as_of itself
+    add_activity(db, user, AS_OF - timedelta(days=6), 10)
+    add_activity(db, user, AS_OF, 20, hour=21)
+    db.commit()
+    
+    acute = MetricsService(db).calculate_acute_load(user, AS_OF)
+    print(f"Acute load: {acute}")
+    assert acute == 30, f"expected 30 (as_of-6 and as_of only), got {acute}"
+    print("✅ Acute Load Window Passed")
+
+def test_fitness_history_bulk():
+    print("\nTesting bulk fitness history...")
+    db = make_db()
+    today = date.today()
+    runner = User(id=1, email="runner@example.com")
+    other = User(id=2, email="other@example.com")
+    idle = User(id=3, email="idle@example.com")
+    db.add_all([runner, other, idle])
+    
+    # Warmup period, two runs on one day, excluded and future activities
+    add_activity(db, runner, today - timedelta(days=200), 80)
+    add_activity(db, runner, today - timedelta(days=30), 50)
+    add_activity(db, runner, today - timedelta(days=30), 40, hour=18)
+    add_activity(db, runner, today - timedelta(days=3), 1000, included=False)
+    add_activity(db, runner, today, 60, hour=21)
+    add_activity(db, runner, today + timedelta(days=1), 1000)
+    add_activity(db, other, today - timedelta(days=95), 120)
+    add_activity(db, other, today - timedelta(days=10), 70)
+    db.commit()
+    
+    service = MetricsService(db)
+    bulk = service.get_fitness_history_bulk([runner.id, other.id, idle.id], days=90)
+    assert sorted(bulk) == [runner.id, other.id, idle.id], sorted(bulk)
+    for user in (runner, other, idle):
+        expected = service.get_fitness_history(user, days=90)
+        got = bulk[user.id]
+        assert got.dates == expected.dates, f"user {user.id}: dates differ"
+        for field in ("ctl_values", "atl_values", "tsb_values"):
+            pairs = zip(getattr(got, field), getattr(expected, field))
+            assert all(math.isclose(a, b, abs_tol=1e-9) for a, b in pairs), f"user {user.id}: {field} differ"
+    assert any(bulk[runner.id].ctl_values) and not any(bulk[idle.id].ctl_values)
+    print(f"Runner CTL today: {bulk[runner.id].ctl_values[-1]:.2f}")
+    print("✅ Bulk Fitness History Passed")
+
+if __name__ == "__main__":
+    test_acute_load_window()
+    test_fitness_history_bulk()
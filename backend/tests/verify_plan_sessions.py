@@ -0,0 +1,77 @@
+import sys
+import os
+from datetime import date, timedelta
+from unittest.mock import patch
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+# Set dummy env var for Client init
+os.environ["GEMINI_API_KEY"] = "dummy_key_for_testing"
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import User, RaceGoal, PlannedSession
+from app.services.plan_generator_service import PlanGeneratorService, SessionSpec
+
+def make_db():
+    """In-memory SQLite session with every table."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+def test_create_sessions():
+    print("Testing planned session bulk insert...")
+    db = make_db()
+    today = date.today()
+    plan_start = today - timedelta(days=today.weekday())
+
+    user = User(id=1, email="runner@example.com")
+    goal = RaceGoal(
+        id=1, user_id=1, name="Test 10k", race_type="10k",
+        race_date=plan_start + timedelta(weeks=4), target_time_seconds=3000,
+    )
+    db.add_all([user, goal])
+    db.commit()
+
+    spec = SessionSpec(
+        day=3, session_type="interval", duration_minutes=50, intensity="hard",
+        pace_per_km=None, terrain_type="track", elevation_gain=0,
+        intervals=[{"reps": 6, "distance_m": 1000}], workout_details="6x1000m",
+    )
+    plan_structure = [
+        # LLM plans are plain dicts; Sunday of the current week is never in the past
+        {"week_number": 1, "sessions": [{"day": 7, "session_type": "long", "duration_minutes": 90}]},
+        # Fallback plans are specs
+        {"week_number": 2, "phase": "peak", "sessions": [spec]},
+        # After the race: skipped
+        {"week_number": 5, "sessions": [{"day": 3, "session_type": "easy"}]},
+    ]
+    target_paces = {"long": 360, "interval": 270}
+
+    with patch("app.services.llm_service.genai.Client"):
+        generator = PlanGeneratorService(db)
+    sessions = generator._create_sessions(goal, user, plan_structure, target_paces)
+
+    print(f"Sessions: {[(s.session_type, s.scheduled_date) for s in sessions]}")
+    assert [(s.session_type, s.scheduled_date) for s in sessions] == [
+        ("long", plan_start + timedelta(days=6)),
+        ("interval", plan_start + timedelta(weeks=1, days=2)),
+        ("race", goal.race_date),
+    ]
+    # Returned rows are persisted ORM objects
+    assert all(s.id is not None for s in sessions), [s.id for s in sessions]
+    long_run, interval, race = sessions
+    assert long_run.target_pace_per_km == 360 and long_run.week_number == 1
+    assert interval.intervals == [{"reps": 6, "distance_m": 1000}]
+    assert interval.terrain_type == "track" and interval.status == "planned"
+    assert race.race_goal_id == goal.id and race.target_pace_per_km == 300
+
+    stored = db.scalars(select(PlannedSession).order_by(PlannedSession.scheduled_date)).all()
+    assert [s.id for s in stored] == [s.id for s in sessions]
+    print("✅ Planned Session Insert Passed")
+
+if __name__ == "__main__":
+    test_create_sessions()